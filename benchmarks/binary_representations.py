@@ -0,0 +1,29 @@
+"""Compare the size and serialization time of the binary representations of
+:mod:`sanic_restful.output` with the JSON backends, on typical marshalled
+payloads.
+
+    $ python benchmarks/binary_representations.py
+"""
+from payloads import json_serializers, timings
+from sanic_restful.output import cbor2, cbor_dumps, msgpack, msgpack_dumps
+
+
+def serializers():
+    yield from json_serializers('json/')
+    for name, module, dumps in (('msgpack', msgpack, msgpack_dumps),
+                                ('cbor', cbor2, cbor_dumps)):
+        if module is None:
+            print('%-12s not installed' % name)
+        else:
+            yield name, dumps
+
+
+def main():
+    for name, dumps in serializers():
+        for label, microseconds, size in timings(dumps):
+            print('%-12s %-14s %10.2f us/op %9d bytes' % (
+                name, label, microseconds, size))
+
+
+if __name__ == '__main__':
+    main()
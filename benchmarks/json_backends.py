@@ -0,0 +1,16 @@
+"""Compare the JSON backends of :mod:`sanic_restful.output` on typical
+marshalled payloads.
+
+    $ python benchmarks/json_backends.py
+"""
+from payloads import json_serializers, timings
+
+
+def main():
+    for name, dumps in json_serializers():
+        for label, microseconds, _ in timings(dumps):
+            print('%-8s %-14s %10.2f us/op' % (name, label, microseconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Compare fetching the columns of a list of objects value by value with
+the per list getters of :func:`sanic_restful.fields.get_values`, for the
+shapes of objects they specialize on.
+
+    $ python benchmarks/marshal_shapes.py
+"""
+from collections import namedtuple
+from dataclasses import dataclass
+import timeit
+
+from sanic_restful import fields
+
+item_fields = {
+    'id': fields.Integer,
+    'name': fields.String,
+    'price': fields.Float,
+    'active': fields.Boolean,
+}
+
+ItemTuple = namedtuple('ItemTuple', 'id name price active')
+
+
+class ItemSlots:
+    __slots__ = ('id', 'name', 'price', 'active')
+
+    def __init__(self, id, name, price, active):
+        self.id = id
+        self.name = name
+        self.price = price
+        self.active = active
+
+
+@dataclass
+class ItemData:
+    id: int
+    name: str
+    price: float
+    active: bool
+
+
+class ItemObject:
+    def __init__(self, id, name, price, active):
+        self.id = id
+        self.name = name
+        self.price = price
+        self.active = active
+
+
+def make_items(shape, count):
+    rows = [(i, 'item %d' % i, i * 1.25, i % 2 == 0) for i in range(count)]
+    if shape is dict:
+        return [dict(zip(ItemTuple._fields, row)) for row in rows]
+    return [shape(*row) for row in rows]
+
+
+SHAPES = [
+    ('dict', dict),
+    ('namedtuple', ItemTuple),
+    ('__slots__', ItemSlots),
+    ('dataclass', ItemData),
+    ('object', ItemObject),
+]
+
+
+def fetch_per_value(items):
+    # every value looked up on its own, as before get_values
+    columns = []
+    for key in item_fields:
+        get = fields.get_accessor(key)
+        columns.append([get(item) for item in items])
+    return columns
+
+
+def fetch_per_list(items):
+    return [fields.get_values(key, items) for key in item_fields]
+
+
+def main(count=1000, number=500):
+    for label, shape in SHAPES:
+        items = make_items(shape, count)
+        assert fetch_per_value(items) == fetch_per_list(items)
+        per_value = timeit.timeit(
+            lambda: fetch_per_value(items), number=number)
+        per_list = timeit.timeit(
+            lambda: fetch_per_list(items), number=number)
+        print('%-10s per value %6.3f us/row  per list %6.3f us/row  '
+              '(%.2fx)' % (label, per_value / number / count * 1e6,
+                           per_list / number / count * 1e6,
+                           per_value / per_list))
+
+
+if __name__ == '__main__':
+    main()
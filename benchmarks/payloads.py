@@ -0,0 +1,58 @@
+"""The marshalled payloads and the timing loop shared by the serialization
+benchmarks."""
+from datetime import datetime
+import timeit
+
+from sanic_restful import fields, marshal
+from sanic_restful.output import JSON_BACKENDS
+
+item_fields = {
+    'id': fields.Integer,
+    'name': fields.String,
+    'price': fields.Float,
+    'active': fields.Boolean,
+    'created': fields.DateTime(dt_format='iso8601'),
+    'tags': fields.List(fields.String),
+    'owner': {
+        'id': fields.Integer(attribute='owner_id'),
+        'name': fields.String(attribute='owner_name'),
+    },
+}
+
+
+def make_items(count):
+    return [{
+        'id': i,
+        'name': 'item %d' % i,
+        'price': i * 1.25,
+        'active': i % 2 == 0,
+        'created': datetime(2019, 1, 1),
+        'tags': ['a', 'b', 'c'],
+        'owner_id': i % 7,
+        'owner_name': 'owner %d' % (i % 7),
+    } for i in range(count)]
+
+
+# (label, marshalled payload, number of runs)
+PAYLOADS = [
+    ('single object', marshal(make_items(1)[0], item_fields), 20000),
+    ('page of 100', marshal(make_items(100), item_fields), 500),
+    ('page of 10000', marshal(make_items(10000), item_fields), 5),
+]
+
+
+def json_serializers(prefix=''):
+    """Yield the name and ``dumps`` of the installed JSON backends"""
+    for name, backend_cls in JSON_BACKENDS.items():
+        try:
+            yield prefix + name, backend_cls().dumps
+        except RuntimeError:
+            print('%-12s not installed' % (prefix + name))
+
+
+def timings(dumps):
+    """Yield the label, the time per call in microseconds and the
+    serialized size of every payload"""
+    for label, payload, number in PAYLOADS:
+        seconds = timeit.timeit(lambda: dumps(payload), number=number)
+        yield label, seconds / number * 1e6, len(dumps(payload))
@@ -1,5 +1,8 @@
 from sanic_restful.api import Api
 from sanic_restful.resource import Resource
-from sanic_restful.marshal import marshal_with, marshal
+from sanic_restful.marshal import marshal_with, marshal, async_marshal
+from sanic_restful.cache import CachePolicy
+from sanic_restful.executor import run_in_executor
 
-__all__ = ['Api', 'Resource', 'marshal_with', 'marshal']
+__all__ = ['Api', 'Resource', 'marshal_with', 'marshal', 'async_marshal',
+           'CachePolicy', 'run_in_executor']
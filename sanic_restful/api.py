@@ -1,18 +1,30 @@
 from collections import OrderedDict
 from functools import wraps
+from time import perf_counter
 
 from sanic import Blueprint, Sanic
 from sanic.exceptions import ServerError
-from sanic.response import BaseHTTPResponse, text
+from sanic.response import BaseHTTPResponse, HTTPResponse, text
+from sanic_restful.cache import (
+    CacheEntry, MemoryCache, _resolve, get_cache_policy)
+from sanic_restful.coalesce import Coalescer, get_coalesce_policy
+from sanic_restful.compression import Compressor
+from sanic_restful.conditional import etag_matches, make_etag, not_modified
 from sanic_restful.exceptions import NotAcceptable
-from sanic_restful.output import output_json
-from sanic_restful.util import unpack
-
-from werkzeug.http import parse_accept_header
+from sanic_restful.executor import ExecutorPool, Offloader
+from sanic_restful.metrics import (
+    MemorySink, prometheus_view, start_timer, stop_timer)
+from sanic_restful.negotiation import (NegotiationCache, Negotiator,
+                                       refresh_negotiator)
+from sanic_restful.output import (
+    BINARY_REPRESENTATIONS, JSONBackend, RawJSON, get_json_backend,
+    output_json, output_ndjson)
+from sanic_restful.util import is_stream, request_state, unpack
 
 DEFAULT_REPRESENTATIONS = [
-    ('application/json', output_json)
-]
+    ('application/json', output_json),
+    ('application/x-ndjson', output_ndjson),
+] + BINARY_REPRESENTATIONS
 
 
 class Api:
@@ -47,6 +59,42 @@ class Api:
     :param errors: A dictionary to define a custom response for each
         exception or error raised during a request
     :type errors: dict
+    :param json_backend: The :class:`~sanic_restful.output.JSONBackend`, or
+        the name of one, serializing ``application/json`` responses.
+        Defaults to the ``RESTFUL_JSON_BACKEND`` config of the application,
+        or the standard :mod:`json` module; ``'auto'`` picks the fastest
+        installed library. It is resolved once, together with the
+        ``RESTFUL_JSON`` settings, when the application is initialized.
+    :param negotiation_cache_size: The number of negotiated media types kept
+        in :attr:`negotiation_cache`
+    :type negotiation_cache_size: int
+    :param response_cache: The :class:`~sanic_restful.cache.CacheBackend`
+        storing the responses of resources with a ``cache`` policy, an
+        in-process :class:`~sanic_restful.cache.MemoryCache` by default
+    :param etag: Send an ``ETag`` hashed from the body of every successful
+        ``GET`` response, and answer requests whose ``If-None-Match`` header
+        matches with ``304 Not Modified``. Resources can supply their own
+        version tokens instead, see :attr:`Resource.etag`.
+    :type etag: bool
+    :param compression: A :class:`~sanic_restful.compression.Compressor`
+        compressing the responses of resources, or ``True`` for the default
+        one (gzip and deflate). Compressed responses are stored in
+        :attr:`response_cache` per encoding.
+    :param offload: An :class:`~sanic_restful.executor.Offloader`, or
+        ``True`` for the default one, serializing large ``application/json``
+        responses and the large results of
+        :class:`~sanic_restful.marshal.marshal_with` in an executor rather
+        than on the event loop
+    :param executor_pools: A dict of name to
+        :class:`~sanic_restful.executor.ExecutorPool`, the pools
+        :func:`~sanic_restful.executor.run_in_executor` runs handlers in
+    :param metrics: A :class:`~sanic_restful.metrics.MetricsSink` recording
+        the latency of the phases of the requests to every endpoint, or
+        ``True`` for an in-memory :class:`~sanic_restful.metrics.MemorySink`.
+        Nothing is timed without it.
+    :param coalesce: A :class:`~sanic_restful.coalesce.CoalescePolicy`
+        applying to the resources that don't set their own ``coalesce``
+        policy, identical concurrent requests then share one response
 
     """
 
@@ -58,7 +106,16 @@ class Api:
                  catch_all_404s=False,
                  serve_challenge_on_401=False,
                  url_part_order="bae",
-                 errors=None):
+                 errors=None,
+                 json_backend=None,
+                 negotiation_cache_size=256,
+                 response_cache=None,
+                 etag=False,
+                 compression=None,
+                 offload=None,
+                 executor_pools=None,
+                 metrics=None,
+                 coalesce=None):
         self.representations = OrderedDict(DEFAULT_REPRESENTATIONS)
         self.urls = {}
         self.prefix = prefix
@@ -73,6 +130,20 @@ class Api:
         self.resources = []
         self.app = None
         self.blueprint = None
+        self.json_backend = json_backend
+        self.negotiation_cache = NegotiationCache(negotiation_cache_size)
+        self._negotiator = Negotiator(self.representations,
+                                      self.negotiation_cache)
+        self.response_cache = response_cache if response_cache is not None \
+            else MemoryCache()
+        self.etag = etag
+        self.compression = Compressor() if compression is True \
+            else compression
+        self.offloader = Offloader() if offload is True else offload
+        self.executor_pools = dict(executor_pools or {})
+        self.metrics = MemorySink() if metrics is True else metrics
+        self.coalesce = coalesce
+        self.coalescer = Coalescer()
 
         if app:
             self.app = app
@@ -98,17 +169,35 @@ class Api:
             # TODO: register api resource for bp that call add resource function
             app.register = self._sanic_blueprint_register_hook(app)
         elif isinstance(app, Sanic):
+            self._configure_json(app)
             self.register_api(app)
         else:
             raise TypeError("only support sanic object and blupirint")
 
     def _sanic_blueprint_register_hook(self, bp: Blueprint):
         def register(app, options):
+            self._configure_json(app)
             bp_obj = self._bp_register(app, options)
             self.register_api(bp)
             return bp_obj
         return register
 
+    def _configure_json(self, app):
+        """Resolve the JSON backend from the application config and bind it
+        as the ``application/json`` and ``application/x-ndjson``
+        representations, unless they have been replaced with
+        :meth:`representation`."""
+        self.json_backend = get_json_backend(
+            self.json_backend or app.config.get('RESTFUL_JSON_BACKEND'),
+            app.config.get('RESTFUL_JSON'))
+        if self.representations.get('application/json') is output_json:
+            self.representations['application/json'] = \
+                self.json_backend.output
+        if self.representations.get('application/x-ndjson') is \
+                output_ndjson:
+            self.representations['application/x-ndjson'] = \
+                self.json_backend.output_ndjson
+
     def register_api(self, app):
         if len(self.resources) > 0:
             for resource, urls, kwargs in self.resources:
@@ -123,9 +212,18 @@ class Api:
         # Why?
         # resouce.mediatypes = self.mediatypes
         resource.endpoint = endpoint
+        if resource.representations:
+            resource.negotiator = Negotiator(resource.representations,
+                                             self.negotiation_cache)
+        if resource.coalesce is None and self.coalesce is not None:
+            resource.coalesce = self.coalesce
         resource_func = self.output(
             resource.as_view(self, *resource_class_args,
                              **resource_class_kwargs))
+        if resource.coalesce is not None:
+            resource_func = self.coalesced(resource_func, resource, endpoint)
+        if resource.cache is not None:
+            resource_func = self.cached(resource_func, resource, endpoint)
 
         for decorator in self.decorators:
             resource_func = decorator(resource_func)
@@ -150,14 +248,208 @@ class Api:
 
         :param resource: The resource as a flask view function
         """
+        resource_cls = getattr(resource, 'view_class', None)
+        conditional = self.etag or \
+            getattr(resource_cls, 'etag', None) is not None
+        metrics = self.metrics
+        endpoint = getattr(resource_cls, 'endpoint', None) or \
+            resource.__name__
+
         @wraps(resource)
         async def wrapper(request, *args, **kwargs):
+            if metrics is None:
+                return await respond(request, None, *args, **kwargs)
+            timer, token = start_timer()
+            try:
+                return await respond(request, timer, *args, **kwargs)
+            finally:
+                stop_timer(token)
+
+        async def respond(request, timer, *args, **kwargs):
+            # read by marshal_with and the resources
+            state = request_state(request)
+            state['api'] = self
             resp = await resource(request, *args, **kwargs)
-            if isinstance(resp, BaseHTTPResponse):
-                return resp
-            else:
+            if timer is not None:
+                handled = perf_counter()
+            if is_stream(resp):
+                # streamed as it is produced by the representation
+                resp = self.make_response(request, resp, 200, headers={})
+            elif not isinstance(resp, BaseHTTPResponse):
                 data, code, headers = unpack(resp)
-            return self.make_response(request, data, code, headers=headers)
+                if self.offloader is not None:
+                    data = await self.serialize_offloaded(request, data)
+                resp = self.make_response(request, data, code,
+                                          headers=headers)
+            if self.offloader is not None:
+                self.offloader.finish(state)
+            if conditional:
+                resp = self.conditional_response(request, resp)
+            if self.compression is not None:
+                resp = await self.compression.compress_response(request, resp)
+            if timer is not None:
+                self.record_phases(endpoint, timer, handled)
+            return resp
+
+        return wrapper
+
+    def record_phases(self, endpoint, timer, handled):
+        """Send the phases of a request to :attr:`metrics`. The ``handler``
+        phase excludes the parsing and marshalling that happened within the
+        handler, ``serialize`` runs from the end of the handler to the
+        response, rendered and compressed.
+
+        :param timer: The :class:`~sanic_restful.metrics.PhaseTimer` of the
+            request
+        :param handled: When the handler returned, as a
+            :func:`time.perf_counter` value
+        """
+        end = perf_counter()
+        phases = timer.phases
+        observe = self.metrics.observe
+        for phase in ('parse', 'marshal'):
+            if phase in phases:
+                observe(endpoint, phase, phases[phase])
+        observe(endpoint, 'handler', handled - timer.start -
+                phases.get('parse', 0.0) - phases.get('marshal', 0.0))
+        observe(endpoint, 'serialize', end - handled)
+        observe(endpoint, 'total', end - timer.start)
+
+    def add_metrics_route(self, uri='/metrics', app=None):
+        """Serve the histograms of :attr:`metrics`, a
+        :class:`~sanic_restful.metrics.MemorySink`, to Prometheus.
+
+        :param uri: The route of the metrics
+        :param app: The application or blueprint to add the route to,
+            defaults to the application of the api
+        """
+        app = app or self.app
+        if app is None:
+            raise RuntimeError("the api has no application yet, pass one")
+        if not hasattr(self.metrics, 'prometheus_text'):
+            raise TypeError("the metrics sink can't render Prometheus text")
+        app.add_route(prometheus_view(self.metrics), uri, methods=['GET'])
+
+    async def serialize_offloaded(self, request, data):
+        """Serialize ``data`` to :class:`~sanic_restful.output.RawJSON` in
+        the executor of :attr:`offloader`, when it is large and the
+        negotiated representation is the ``application/json`` one of
+        :attr:`json_backend`. Otherwise return it as is, to be serialized
+        on the event loop by :meth:`make_response`.
+        """
+        backend = self.json_backend
+        if isinstance(data, RawJSON) or not isinstance(backend, JSONBackend):
+            return data
+        mediatype = self.negotiate(request, default=self.default_mediatype)
+        if self.representations.get(mediatype) != backend.output:
+            return data
+        dumps = backend.dumps_debug if request.app.debug else backend.dumps
+        if not self.offloader.should_offload(data, dumps,
+                                             request_state(request)):
+            return data
+        return RawJSON(await self.offloader.run(
+            'serialize', dumps, data, process=True))
+
+    def conditional_response(self, request, resp):
+        """Set the ``ETag`` of a successful ``GET`` response, either the
+        version token of the resource or, when :attr:`etag` is on, a hash of
+        the body. Return a ``304 Not Modified`` response instead when the
+        ``If-None-Match`` header of the request matches it.
+        """
+        if request.method not in ('GET', 'HEAD') or resp.status != 200 or \
+                not isinstance(resp, HTTPResponse):
+            return resp
+        etag = resp.headers.get('ETag')
+        if etag is None:
+            etag = request_state(request).get('etag')
+            if etag is None:
+                if not self.etag:
+                    return resp
+                etag = make_etag(resp.body)
+            resp.headers['ETag'] = etag
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return not_modified(etag, resp)
+        return resp
+
+    def cached(self, view, resource, endpoint):
+        """Wraps the view of a resource to serve its responses from
+        :attr:`response_cache`, following the ``cache`` policies of the
+        resource (see :class:`~sanic_restful.cache.CachePolicy`). A cached
+        response replaces the result of the handler: the decorators of the
+        resource still run, but not the handler, marshalling or
+        serialization.
+
+        :param view: The view returned by :meth:`output`
+        :param resource: The :class:`Resource` class of the view
+        :param endpoint: The endpoint the responses are cached under
+        """
+        cache = self.response_cache
+
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            policy = get_cache_policy(resource, request.method)
+            if policy is None:
+                return await view(request, *args, **kwargs)
+            negotiator = resource.get_negotiator() or self.negotiator
+            mediatype = negotiator.best_match(
+                request.headers.get('accept', None), self.default_mediatype)
+            key = policy.make_key(endpoint, request, kwargs, mediatype)
+            if self.compression is not None:
+                # compressed variants are cached next to the plain one
+                key += self.compression.negotiate(
+                    request.headers.get('accept-encoding')) or ''
+            entry = await _resolve(cache.get(key))
+            if entry is not None:
+                request_state(request)['cached_response'] = \
+                    entry.to_response()
+            resp = await view(request, *args, **kwargs)
+            if entry is None and policy.is_cacheable(resp):
+                await _resolve(cache.set(
+                    key, CacheEntry.from_response(resp), policy.ttl))
+            return resp
+        return wrapper
+
+    def coalesced(self, view, resource, endpoint):
+        """Wraps the view of a resource so that identical concurrent requests
+        share the response of the first one, following the ``coalesce``
+        policy of the resource (see
+        :class:`~sanic_restful.coalesce.CoalescePolicy`). Like cached
+        responses, shared responses replace the result of the handler, the
+        decorators of the resource run for every request.
+
+        :param view: The view returned by :meth:`output`
+        :param resource: The :class:`Resource` class of the view
+        :param endpoint: The endpoint the requests are coalesced under
+        """
+        coalescer = self.coalescer
+
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            policy = get_coalesce_policy(resource, request.method)
+            if policy is None:
+                return await view(request, *args, **kwargs)
+            negotiator = resource.get_negotiator() or self.negotiator
+            accept_encoding = request.headers.get('accept-encoding')
+            key = policy.make_key(
+                endpoint, request, kwargs,
+                negotiator.best_match(request.headers.get('accept', None),
+                                      self.default_mediatype),
+                self.compression.negotiate(accept_encoding)
+                if self.compression is not None else None)
+            state = request_state(request)
+            # the resource joins the coalescer from the state, it may not
+            # keep its api
+            state['coalesce'] = (coalescer, key, policy.timeout)
+            try:
+                resp = await view(request, *args, **kwargs)
+            except Exception as e:
+                coalescer.finish(state, key, exception=e)
+                raise
+            except BaseException:
+                coalescer.finish(state, key)
+                raise
+            coalescer.finish(state, key, response=resp)
+            return resp
         return wrapper
 
     def make_response(self, request, data, *args, **kwargs):
@@ -171,16 +463,15 @@ class Api:
         """
         default_mediatype = kwargs.pop("fallback_mediatype",
                                        None) or self.default_mediatype
-        # mediatype = best_match_accept_mimetype(
-        #     request, self.representations, default=default_mediatype)
-        mediatype = parse_accept_header(request.headers.get(
-            'accept', None)).best_match(
-                self.representations, default=default_mediatype)
+        mediatype = self.negotiate(request, default=default_mediatype)
         if not mediatype:
             raise NotAcceptable("Not Acceptable")
         if mediatype in self.representations:
-            resp = self.representations[mediatype](request.app, data, *args,
-                                                   **kwargs)
+            representation = self.representations[mediatype]
+            if isinstance(data, RawJSON) and not getattr(
+                    representation, 'accepts_raw_json', False):
+                data = data.load()
+            resp = representation(request.app, data, *args, **kwargs)
             resp.headers["Content-type"] = mediatype
             return resp
         elif mediatype == "text/plain":
@@ -189,6 +480,33 @@ class Api:
         else:
             raise ServerError(None)
 
+    def executor_pool(self, name='default'):
+        """Return the :class:`~sanic_restful.executor.ExecutorPool` named
+        ``name`` of :attr:`executor_pools`, pools that were not configured
+        are created with the default settings on first use"""
+        try:
+            return self.executor_pools[name]
+        except KeyError:
+            pool = self.executor_pools[name] = ExecutorPool()
+            return pool
+
+    @property
+    def negotiator(self):
+        """The :class:`~sanic_restful.negotiation.Negotiator` of
+        :attr:`representations`, rebuilt when they change"""
+        negotiator = self._negotiator = refresh_negotiator(
+            self._negotiator, self.representations)
+        return negotiator
+
+    def negotiate(self, request, default=None):
+        """Return the media type of :attr:`representations` that best
+        matches the ``Accept`` header of the request, or ``default``.
+        Results are cached in :attr:`negotiation_cache`, which the
+        representations of the resources of this api share.
+        """
+        return self.negotiator.best_match(
+            request.headers.get('accept', None), default)
+
     def _complete_url(self, url_part, registration_prefix):
         """This method is used to defer the construction of the final url in
         the case that the Api is created with a Blueprint.
@@ -285,6 +603,7 @@ class Api:
 
         def wrapper(func):
             self.representations[mediatype] = func
+            self.negotiation_cache.clear()
             return func
 
         return wrapper
@@ -0,0 +1,236 @@
+from collections import OrderedDict
+from inspect import isawaitable
+from json import dumps, loads
+from time import monotonic
+
+from sanic.response import HTTPResponse, raw
+
+
+class CachePolicy:
+    """How the responses of a resource method are cached by the
+    :class:`~sanic_restful.Api`, set with the ``cache`` attribute of a
+    :class:`~sanic_restful.Resource`: ::
+
+        class Todo(Resource):
+            cache = {'get': CachePolicy(ttl=30, vary=['accept-language'])}
+
+    Responses are cached under the endpoint, the method, the URL arguments,
+    the query string and the negotiated media type of the request.
+
+    :param ttl: the number of seconds a response is kept, ``None`` keeps it
+        until it is evicted
+    :param vary: names of request headers whose values are added to the key
+    :param statuses: the status codes of the responses that are cached
+    """
+
+    def __init__(self, ttl=None, vary=(), statuses=(200,)):
+        self.ttl = ttl
+        self.vary = tuple(header.lower() for header in vary)
+        self.statuses = frozenset(statuses)
+
+    def make_key(self, endpoint, request, args, mediatype):
+        """Return the cache key of a request as a string"""
+        headers = request.headers
+        return dumps([
+            endpoint,
+            request.method,
+            sorted((key, str(value)) for key, value in args.items()),
+            request.query_string,
+            mediatype,
+            [headers.get(header) for header in self.vary],
+        ], separators=(',', ':'))
+
+    def is_cacheable(self, response):
+        """Whether ``response`` can be stored: it has a cached status, a body
+        that is not streamed, and sets no cookies"""
+        return (response.status in self.statuses and
+                isinstance(response, HTTPResponse) and
+                'Set-Cookie' not in response.headers)
+
+
+def get_cache_policy(resource, method):
+    """Return the :class:`CachePolicy` of ``resource`` for the HTTP
+    ``method``, or ``None``. A single policy applies to ``GET`` requests."""
+    cache = getattr(resource, 'cache', None)
+    if cache is None:
+        return None
+    if isinstance(cache, CachePolicy):
+        return cache if method == 'GET' else None
+    return cache.get(method.lower())
+
+
+class CacheEntry:
+    """A serialized response as it is stored in a cache backend
+
+    :param body: the body of the response, as bytes
+    :param status: the status code
+    :param headers: a list of ``(name, value)`` pairs
+    :param content_type: the content type of the response
+    """
+    __slots__ = ('body', 'status', 'headers', 'content_type')
+
+    def __init__(self, body, status=200, headers=(), content_type=None):
+        self.body = body
+        self.status = status
+        self.headers = list(headers)
+        self.content_type = content_type
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.body, response.status,
+                   response.headers.items(), response.content_type)
+
+    def to_response(self):
+        """Build a new response, so the entry can't be altered by the
+        handlers it is served to"""
+        return raw(self.body, status=self.status, headers=self.headers,
+                   content_type=self.content_type)
+
+    @property
+    def size(self):
+        return len(self.body)
+
+    def dump(self):
+        """Serialize the entry to bytes, see :meth:`load`"""
+        meta = dumps([self.status, self.headers, self.content_type])
+        return meta.encode() + b'\n' + self.body
+
+    @classmethod
+    def load(cls, data):
+        meta, _, body = data.partition(b'\n')
+        status, headers, content_type = loads(meta.decode())
+        return cls(body, status, [tuple(pair) for pair in headers],
+                   content_type)
+
+
+class CacheBackend:
+    """The interface of the backends an :class:`~sanic_restful.Api` stores
+    cached responses in. Methods may return awaitables, for backends that
+    talk to a server."""
+
+    def get(self, key):
+        """Return the :class:`CacheEntry` stored under ``key``, or ``None``"""
+        raise NotImplementedError
+
+    def set(self, key, entry, ttl=None):
+        """Store ``entry`` under ``key`` for ``ttl`` seconds, or until it is
+        evicted if ``ttl`` is ``None``"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """An in-process LRU cache of responses, the default backend.
+
+    :param maxsize: the number of responses kept
+    :param max_bytes: the total size of the bodies kept, larger bodies are
+        never stored
+    """
+
+    def __init__(self, maxsize=1024, max_bytes=64 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        try:
+            entry, expires = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        if expires is not None and expires <= monotonic():
+            self.delete(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def set(self, key, entry, ttl=None):
+        if entry.size > self.max_bytes:
+            return
+        self.delete(key)
+        expires = None if ttl is None else monotonic() + ttl
+        self._entries[key] = (entry, expires)
+        self.size += entry.size
+        while len(self._entries) > self.maxsize or \
+                self.size > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def delete(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self.size -= item[0].size
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def info(self):
+        """Return the ``hits``, ``misses``, ``size``, ``bytes``, ``maxsize``
+        and ``max_bytes`` of the cache"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'bytes': self.size,
+            'maxsize': self.maxsize,
+            'max_bytes': self.max_bytes,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache(CacheBackend):
+    """Stores responses in Redis, or anything with the same ``get``,
+    ``set(key, value, ex=None)``, ``delete`` and ``scan_iter`` methods.
+    Both blocking clients (``redis.Redis``) and asyncio ones
+    (``redis.asyncio.Redis``) are supported, size based eviction is left to
+    the ``maxmemory`` policy of the server.
+
+    :param client: the Redis client
+    :param prefix: prepended to the keys of the responses
+    """
+
+    def __init__(self, client, prefix='sanic_restful:'):
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key):
+        data = await _resolve(self.client.get(self.prefix + key))
+        if data is None:
+            return None
+        return CacheEntry.load(data)
+
+    async def set(self, key, entry, ttl=None):
+        ex = None if ttl is None else max(1, int(ttl))
+        await _resolve(self.client.set(self.prefix + key, entry.dump(),
+                                       ex=ex))
+
+    async def delete(self, key):
+        await _resolve(self.client.delete(self.prefix + key))
+
+    async def clear(self):
+        keys = self.client.scan_iter(match=self.prefix + '*')
+        if hasattr(keys, '__aiter__'):
+            keys = [key async for key in keys]
+        else:
+            keys = list(keys)
+        if keys:
+            await _resolve(self.client.delete(*keys))
+
+
+async def _resolve(value):
+    if isawaitable(value):
+        return await value
+    return value
@@ -0,0 +1,116 @@
+import asyncio
+
+from sanic.response import HTTPResponse
+from sanic_restful.cache import CacheEntry
+
+
+class CoalescePolicy:
+    """Coalesces identical concurrent requests to a resource, set with the
+    ``coalesce`` attribute of a :class:`~sanic_restful.Resource` or the
+    ``coalesce`` argument of the :class:`~sanic_restful.Api`: the first
+    request runs the handler, and the requests with the same key that
+    arrive while it is in flight wait for its response and share it.
+
+    By default requests are coalesced on the endpoint, the URL arguments,
+    the query string and the negotiated media type and encoding.
+
+    :param timeout: the number of seconds a request waits for the response
+        of another one, after which it runs the handler itself
+    :param key: a function ``key(request, args)`` returning the key of a
+        request, replacing the default one
+    :param methods: the HTTP methods whose requests are coalesced
+    """
+
+    def __init__(self, timeout=10.0, key=None, methods=('GET',)):
+        self.timeout = timeout
+        self.key = key
+        self.methods = frozenset(method.upper() for method in methods)
+
+    def make_key(self, endpoint, request, args, mediatype, encoding=None):
+        """Return the coalescing key of a request"""
+        if self.key is not None:
+            return endpoint, self.key(request, args)
+        args = tuple(sorted((name, str(value))
+                            for name, value in args.items()))
+        return (endpoint, request.method, args, request.query_string,
+                mediatype, encoding)
+
+
+class Coalescer:
+    """Keeps track of the requests in flight for every coalescing key, see
+    :class:`CoalescePolicy`. Followers await a future which the leader
+    resolves with its response, or its exception."""
+
+    def __init__(self):
+        self.inflight = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    async def join(self, state, key, timeout):
+        """Join the computation in flight for ``key``. Return the response
+        to send if another request computed it, or ``None`` when the caller
+        has to run the handler: it then leads, and must :meth:`finish`.
+
+        :param state: the state of the request, see
+            :func:`~sanic_restful.util.request_state`
+        """
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.get_event_loop().create_future()
+            self.inflight[key] = state['coalesce_leader'] = future
+            self.leaders += 1
+            return None
+        try:
+            entry = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+        except Exception:
+            self.errors += 1
+            raise
+        if entry is None:
+            # the response of the leader can't be shared
+            return None
+        self.coalesced += 1
+        return entry.to_response()
+
+    def finish(self, state, key, response=None, exception=None):
+        """Hand the ``response`` or ``exception`` of a leading request to
+        its followers. Does nothing for requests that didn't lead."""
+        future = state.pop('coalesce_leader', None)
+        if future is None:
+            return
+        if self.inflight.get(key) is future:
+            del self.inflight[key]
+        if exception is not None:
+            future.set_exception(exception)
+            # followers may not be waiting, don't warn about it
+            future.exception()
+        elif isinstance(response, HTTPResponse) and response.status != 304:
+            # a 304 only answers the conditional headers of the leader
+            future.set_result(CacheEntry.from_response(response))
+        else:
+            future.set_result(None)
+
+    def info(self):
+        """Return the number of ``leaders``, the requests they ``coalesced``,
+        the followers that gave up waiting (``timeouts``) or received an
+        ``errors``, and the keys ``inflight``"""
+        return {
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'inflight': len(self.inflight),
+        }
+
+
+def get_coalesce_policy(resource, method):
+    """Return the :class:`CoalescePolicy` of ``resource`` for the HTTP
+    ``method``, or ``None``"""
+    policy = getattr(resource, 'coalesce', None)
+    if policy is None or method not in policy.methods:
+        return None
+    return policy
@@ -0,0 +1,135 @@
+import asyncio
+import gzip
+import zlib
+
+from sanic.response import HTTPResponse
+
+# Content types whose bodies are worth compressing, besides text/*
+COMPRESSIBLE_TYPES = frozenset([
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/x-ndjson',
+    'image/svg+xml',
+])
+
+
+def _gzip(body, level):
+    # a fixed mtime keeps the output, and the etags derived from it, stable
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _deflate(body, level):
+    return zlib.compress(body, level)
+
+
+COMPRESSORS = {
+    'gzip': _gzip,
+    'deflate': _deflate,
+}
+
+
+class Compressor:
+    """Compresses the responses of an :class:`~sanic_restful.Api`, with the
+    encodings the client lists in its ``Accept-Encoding`` header.
+
+    :param encodings: the supported encodings, of :data:`COMPRESSORS`, in
+        order of preference
+    :param min_size: bodies smaller than this many bytes are sent as they
+        are
+    :param level: the compression level, from 1 (fastest) to 9 (smallest)
+    :param executor_threshold: bodies of at least this many bytes are
+        compressed in ``executor`` rather than on the event loop, ``None``
+        never offloads
+    :param executor: the :class:`concurrent.futures.Executor` large bodies
+        are compressed in, the default executor of the loop if ``None``
+    """
+
+    def __init__(self, encodings=('gzip', 'deflate'), min_size=500, level=6,
+                 executor_threshold=256 * 1024, executor=None):
+        unknown = set(encodings) - set(COMPRESSORS)
+        if unknown:
+            raise ValueError('Unknown encodings: %s' %
+                             ', '.join(sorted(unknown)))
+        self.encodings = tuple(encodings)
+        self.min_size = min_size
+        self.level = level
+        self.executor_threshold = executor_threshold
+        self.executor = executor
+        self._negotiated = {}
+
+    def negotiate(self, accept_encoding):
+        """Return the encoding to compress with for an ``Accept-Encoding``
+        header, or ``None``. The result is cached per header value."""
+        if not accept_encoding:
+            return None
+        try:
+            return self._negotiated[accept_encoding]
+        except KeyError:
+            pass
+        qualities = {}
+        for coding in accept_encoding.split(','):
+            name, *params = coding.split(';')
+            quality = 1.0
+            for param in params:
+                key, _, value = param.partition('=')
+                if key.strip().lower() == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            qualities[name.strip().lower()] = quality
+        wildcard = qualities.get('*', 0.0)
+        best, best_quality = None, 0.0
+        for encoding in self.encodings:
+            quality = qualities.get(encoding, wildcard)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        if len(self._negotiated) >= 256:
+            self._negotiated.clear()
+        self._negotiated[accept_encoding] = best
+        return best
+
+    def is_compressible(self, response):
+        if not isinstance(response, HTTPResponse) or \
+                response.status in (204, 304) or \
+                len(response.body) < self.min_size or \
+                'Content-Encoding' in response.headers:
+            return False
+        content_type = response.headers.get('Content-Type') or \
+            response.content_type or ''
+        content_type = content_type.split(';', 1)[0].strip().lower()
+        return content_type.startswith('text/') or \
+            content_type in COMPRESSIBLE_TYPES
+
+    def compress(self, body, encoding):
+        return COMPRESSORS[encoding](body, self.level)
+
+    async def compress_response(self, request, response):
+        """Compress the body of ``response`` in place, if the client accepts
+        it and the body is large enough, and return the response"""
+        if not self.is_compressible(response):
+            return response
+        vary = response.headers.get('Vary')
+        if not vary or 'accept-encoding' not in vary.lower():
+            response.headers['Vary'] = \
+                vary + ', Accept-Encoding' if vary else 'Accept-Encoding'
+        encoding = self.negotiate(request.headers.get('accept-encoding'))
+        if encoding is None:
+            return response
+        body = response.body
+        threshold = self.executor_threshold
+        if threshold is not None and len(body) >= threshold:
+            loop = asyncio.get_event_loop()
+            body = await loop.run_in_executor(
+                self.executor, self.compress, body, encoding)
+        else:
+            body = self.compress(body, encoding)
+        response.body = body
+        response.headers['Content-Encoding'] = encoding
+        etag = response.headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            # the compressed body is no longer byte for byte the entity the
+            # tag was computed for
+            response.headers['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,50 @@
+from hashlib import blake2b
+
+from sanic.response import HTTPResponse
+
+# Headers a 304 response repeats from the response it stands for, see
+# RFC 7232 section 4.1
+NOT_MODIFIED_HEADERS = ('Cache-Control', 'Content-Location', 'Date',
+                        'Expires', 'Vary')
+
+
+def make_etag(body):
+    """Return a strong entity tag for the bytes of a response body"""
+    return '"%s"' % blake2b(body, digest_size=16).hexdigest()
+
+
+def quote_etag(token):
+    """Turn a version token into an entity tag, tokens that are already
+    quoted (eg. ``W/"1"``) are kept as they are"""
+    token = str(token)
+    if token.startswith(('"', 'W/"')):
+        return token
+    return '"%s"' % token
+
+
+def etag_matches(if_none_match, etag):
+    """Whether the ``If-None-Match`` header of a request matches ``etag``,
+    using the weak comparison of RFC 7232"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(etag, response=None):
+    """Return a ``304 Not Modified`` response for ``etag``, carrying over
+    the caching headers of ``response``"""
+    headers = {'ETag': etag}
+    if response is not None:
+        for name in NOT_MODIFIED_HEADERS:
+            if name in response.headers:
+                headers[name] = response.headers[name]
+    return HTTPResponse(status=304, headers=headers)
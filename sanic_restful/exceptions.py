@@ -9,3 +9,8 @@ class MethodNotAllowed(SanicException):
 @add_status_code(406)
 class NotAcceptable(SanicException):
     pass
+
+
+@add_status_code(503)
+class ServiceUnavailable(SanicException):
+    pass
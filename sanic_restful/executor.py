@@ -0,0 +1,276 @@
+import asyncio
+from collections.abc import Mapping
+from contextvars import copy_context
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial, wraps
+from pickle import HIGHEST_PROTOCOL, PicklingError, dumps, loads
+from time import perf_counter
+
+from sanic_restful.exceptions import ServiceUnavailable
+from sanic_restful.util import request_state
+
+
+def _timed(func, *args):
+    # runs in the worker, module level so that process pools can pickle it
+    start = perf_counter()
+    result = func(*args)
+    return result, perf_counter() - start
+
+
+def _timed_pickled(call):
+    # the call is pickled by Offloader.run, so that failing to pickle it is
+    # told apart from the errors it raises
+    func, args = loads(call)
+    return _timed(func, *args)
+
+
+def count_items(data):
+    """The number of rows in a payload: the length of a list, or of the
+    longest list in a dict (eg. an enveloped list)"""
+    if isinstance(data, (list, tuple)):
+        return len(data)
+    if isinstance(data, Mapping):
+        return max([len(value) for value in data.values()
+                    if isinstance(value, (list, tuple))] or [1])
+    return 1
+
+
+def _first_item(data):
+    if isinstance(data, (list, tuple)):
+        return data[0] if data else None
+    if isinstance(data, Mapping):
+        rows = max([value for value in data.values()
+                    if isinstance(value, (list, tuple))] or [()], key=len)
+        return rows[0] if rows else None
+    return None
+
+
+class Offloader:
+    """Moves the marshalling and serialization of large payloads off the
+    event loop, to a thread pool or, for serialization, a process pool.
+
+    :param min_items: payloads of at least this many rows are offloaded, see
+        :func:`count_items`
+    :param min_bytes: payloads whose serialized size is estimated at this
+        many bytes or more are offloaded, the estimate is the size of their
+        first row times their number of rows
+    :param executor: the thread pool, a ``ThreadPoolExecutor`` of
+        ``max_workers`` threads is created on first use if ``None``
+    :param process_executor: a process pool serialization is offloaded to,
+        or ``True`` to create a ``ProcessPoolExecutor``. Payloads or
+        serializers that can't be pickled fall back to the thread pool.
+    :param max_workers: the size of the pools created by the offloader
+    """
+
+    def __init__(self, min_items=2000, min_bytes=1024 * 1024, executor=None,
+                 process_executor=None, max_workers=4):
+        self.min_items = min_items
+        self.min_bytes = min_bytes
+        self.max_workers = max_workers
+        self._executor = executor
+        self._process_executor = process_executor
+        self._owned = []
+        self.inline = 0
+        self.offloaded = {'marshal': 0, 'serialize': 0}
+        self.offloaded_seconds = 0.0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.max_workers, thread_name_prefix='sanic_restful')
+            self._owned.append(self._executor)
+        return self._executor
+
+    @property
+    def process_executor(self):
+        if self._process_executor is True:
+            self._process_executor = ProcessPoolExecutor(self.max_workers)
+            self._owned.append(self._process_executor)
+        return self._process_executor or None
+
+    def should_offload(self, data, dumps=None, state=None):
+        """Whether ``data`` is large enough to be offloaded. ``dumps``
+        serializes the first row for the size estimate, which is skipped
+        without it.
+
+        :param state: the state of the request, see
+            :func:`~sanic_restful.util.request_state`, which remembers
+            whether its payload was offloaded until :meth:`finish` counts it
+        """
+        items = count_items(data)
+        offload = items >= self.min_items
+        if not offload and dumps is not None and \
+                self.min_bytes is not None and items > 1:
+            try:
+                size = len(dumps(_first_item(data)))
+            except (TypeError, ValueError):
+                size = 0
+            offload = size * items >= self.min_bytes
+        if state is not None and items > 1:
+            state['offloaded'] = offload or state.get('offloaded', False)
+        return offload
+
+    def finish(self, state):
+        """Count the request as ``inline`` when its payload, a list, was
+        considered for offloading and handled on the event loop. Single
+        objects aren't counted.
+
+        :param state: the state of the request passed to
+            :meth:`should_offload`
+        """
+        if state.pop('offloaded', None) is False:
+            self.inline += 1
+
+    async def run(self, kind, func, *args, process=False):
+        """Run ``func(*args)`` in the thread pool, or the process pool if
+        ``process`` is true and there is one, and return its result.
+        Calls that can't be pickled run in the thread pool.
+
+        :param kind: what is offloaded, ``'marshal'`` or ``'serialize'``,
+            for the counters of :meth:`info`
+        """
+        loop = asyncio.get_event_loop()
+        executor = self.process_executor if process else None
+        if executor is not None:
+            try:
+                call = dumps((func, args), HIGHEST_PROTOCOL)
+            except (PicklingError, AttributeError, TypeError):
+                # unpicklable payloads or functions, eg. lambdas
+                executor = None
+        if executor is not None:
+            result = await loop.run_in_executor(executor, _timed_pickled,
+                                                call)
+        else:
+            result = await loop.run_in_executor(
+                self.executor, _timed, func, *args)
+        value, elapsed = result
+        self.offloaded[kind] += 1
+        self.offloaded_seconds += elapsed
+        return value
+
+    def info(self):
+        """Return how many requests had their list payload handled
+        ``inline``, how many payloads were ``offloaded``, by kind, and the
+        ``offloaded_seconds`` of work the event loop was spared"""
+        return {
+            'inline': self.inline,
+            'offloaded': dict(self.offloaded),
+            'offloaded_seconds': self.offloaded_seconds,
+        }
+
+    def shutdown(self, wait=True):
+        """Shut the pools created by the offloader down"""
+        for executor in self._owned:
+            executor.shutdown(wait)
+
+
+class ExecutorPool:
+    """A named pool of an :class:`~sanic_restful.Api` that runs blocking
+    calls, see :meth:`~sanic_restful.Api.executor_pool`. The number of calls
+    waiting for a worker is bounded: once ``max_queue`` calls are waiting,
+    further calls are rejected with ``503 Service Unavailable`` rather than
+    piling up.
+
+    :param max_workers: the number of threads or processes of the pool
+    :param max_queue: the number of calls that may wait for a worker,
+        ``None`` for no limit
+    :param process: run calls in processes rather than threads, their
+        functions and arguments must then be picklable
+    :param executor: an executor to use instead of creating one, of
+        ``max_workers`` workers
+    """
+
+    def __init__(self, max_workers=4, max_queue=32, process=False,
+                 executor=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.process = process
+        self._executor = executor
+        self._owned = executor is None
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.process:
+                self._executor = ProcessPoolExecutor(self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix='sanic_restful')
+        return self._executor
+
+    @property
+    def queued(self):
+        """The number of calls waiting for a worker"""
+        return max(0, self.active - self.max_workers)
+
+    async def run(self, func, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` in the pool and return its result
+
+        :exception ServiceUnavailable: when ``max_queue`` calls are already
+            waiting for a worker
+        """
+        if self.max_queue is not None and \
+                self.active >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise ServiceUnavailable('Service Unavailable')
+        self.active += 1
+        call = partial(func, *args, **kwargs)
+        if not self.process:
+            # threads see the context of the request, eg. its phase timer
+            call = partial(copy_context().run, call)
+        try:
+            return await asyncio.get_event_loop().run_in_executor(
+                self.executor, call)
+        finally:
+            self.active -= 1
+            self.completed += 1
+
+    def info(self):
+        """Return the ``active``, ``queued``, ``completed`` and ``rejected``
+        calls of the pool"""
+        return {
+            'active': self.active,
+            'queued': self.queued,
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
+
+    def shutdown(self, wait=True):
+        """Shut the pool down, if it created its executor"""
+        if self._owned and self._executor is not None:
+            self._executor.shutdown(wait)
+            self._executor = None
+
+
+def run_in_executor(pool='default'):
+    """A ``method_decorators`` decorator running a synchronous handler
+    method in the named :class:`ExecutorPool` of the api of the resource,
+    so that it doesn't block the event loop: ::
+
+        class Report(Resource):
+            method_decorators = {'get': run_in_executor(pool='cpu')}
+
+            def get(self, request):
+                return build_report()
+
+    The resource and the request can't be sent to another process, so the
+    pool must be a thread pool. Handlers needing a process pool can await
+    ``self.api.executor_pool(name).run(func, ...)`` with picklable
+    arguments. Coroutine handlers are rejected, they already run on the
+    event loop without blocking it.
+
+    :param pool: the name of the pool
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request, *args, **kwargs):
+            request_state(request)['executor_pool'] = pool
+            return await handler(request, *args, **kwargs)
+        return wrapper
+    # checked by Resource.build_dispatch_table
+    decorator.executor_pool = pool
+    return decorator
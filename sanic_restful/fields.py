@@ -1,12 +1,19 @@
+import asyncio
+import re
 from calendar import timegm
+from copy import copy
 from decimal import Decimal as MyDecimal, ROUND_HALF_EVEN
 from email.utils import formatdate
+from functools import partial
+from operator import attrgetter, itemgetter
+from string import Formatter
 
-from sanic_restful.marshal import marshal
+from sanic_restful.marshal import (compile_fields, encode_json_value,
+                                   is_pending)
 
 __all__ = ["String", "FormattedString", "DateTime", "Float",
            "Integer", "Arbitrary", "Nested", "List", "Raw", "Boolean",
-           "Fixed", "Price"]
+           "Fixed", "Price", "Batched"]
 
 
 class MarshallingException(Exception):
@@ -24,6 +31,24 @@ def is_indexable_but_not_string(obj):
     return not hasattr(obj, "strip") and hasattr(obj, "__iter__")
 
 
+# Whether instances of a type are indexable but not strings, see
+# is_indexable_but_not_string
+_indexable_types = {}
+
+# Compiled accessors by key, bounded in case keys are built dynamically
+_accessors = {}
+_ACCESSORS_MAXSIZE = 4096
+
+
+def _is_indexable_type(cls):
+    try:
+        return _indexable_types[cls]
+    except KeyError:
+        indexable = _indexable_types[cls] = \
+            not hasattr(cls, "strip") and hasattr(cls, "__iter__")
+        return indexable
+
+
 def get_value(key, obj, default=None):
     """Helper for pulling a keyed value off various types of objects"""
     if isinstance(key, int):
@@ -31,19 +56,119 @@ def get_value(key, obj, default=None):
     elif callable(key):
         return key(obj)
     else:
-        return _get_value_for_keys(key.split('.'), obj, default)
+        return get_accessor(key)(obj, default)
 
 
-def _get_value_for_keys(keys, obj, default):
+def get_accessor(key):
+    """Compile ``key`` into an ``accessor(obj, default=None)`` function
+    equivalent to ``get_value(key, obj, default)``. Dotted keys are split
+    once into a chain of single key lookups, and accessors for string keys
+    are cached.
+    """
+    if isinstance(key, int):
+        return partial(_get_value_for_key, key)
+    elif callable(key):
+        return _callable_accessor(key)
+    try:
+        return _accessors[key]
+    except KeyError:
+        pass
+    keys = key.split('.')
     if len(keys) == 1:
-        return _get_value_for_key(keys[0], obj, default)
+        accessor = _key_accessor(key)
     else:
-        return _get_value_for_keys(
-            keys[1:], _get_value_for_key(keys[0], obj, default), default)
-
-
-def _get_value_for_key(key, obj, default):
-    if is_indexable_but_not_string(obj):
+        accessor = _path_accessor([_key_accessor(k) for k in keys])
+    if len(_accessors) >= _ACCESSORS_MAXSIZE:
+        _accessors.clear()
+    _accessors[key] = accessor
+    return accessor
+
+
+def _callable_accessor(func):
+    def accessor(obj, default=None):
+        return func(obj)
+    return accessor
+
+
+def _key_accessor(key):
+    def accessor(obj, default=None):
+        if _is_indexable_type(obj.__class__):
+            try:
+                return obj[key]
+            except (IndexError, TypeError, KeyError):
+                pass
+        return getattr(obj, key, default)
+    return accessor
+
+
+def _path_accessor(accessors):
+    def accessor(obj, default=None):
+        for get in accessors:
+            obj = get(obj, default)
+        return obj
+    return accessor
+
+
+def get_values(key, objs):
+    """Pull ``key`` from every object of a list, this gives the same values
+    as ``[get_value(key, obj) for obj in objs]``.
+
+    Lists almost always hold objects of a single type, so the type of the
+    first object picks a getter for the whole list: items of dicts and other
+    indexables, attributes of namedtuples, ``__slots__`` objects, dataclasses
+    and plain objects. The per object lookup is used when the specialized
+    getter fails, because the key is missing or the type of the objects
+    changes along the list.
+    """
+    if not isinstance(key, str) or not objs:
+        accessor = get_accessor(key)
+        return [accessor(obj) for obj in objs]
+    if '.' in key:
+        for part in key.split('.'):
+            objs = get_values(part, objs)
+        return objs
+    getter = _shape_getter(objs[0].__class__, key)
+    try:
+        return list(map(getter, objs))
+    except (IndexError, TypeError, KeyError, AttributeError):
+        pass
+    accessor = _key_accessor(key)
+    return [accessor(obj) for obj in objs]
+
+
+async def get_values_async(key, objs, context):
+    """Async counterpart of :func:`get_values`, the pending values met
+    along a dotted key are awaited before going further, see
+    :meth:`~sanic_restful.marshal.MarshalContext.resolve`"""
+    if isinstance(key, str) and '.' in key:
+        parts = key.split('.')
+        for part in parts[:-1]:
+            objs = await context.resolve(get_values(part, objs))
+        key = parts[-1]
+    return get_values(key, objs)
+
+
+def _single_type(objs):
+    """The type of the objects of a non-empty list, or ``None`` when they
+    aren't all of the same type. This scans the list, :func:`get_values`
+    only samples its first object."""
+    cls = objs[0].__class__
+    if len(set(map(type, objs))) == 1:
+        return cls
+    return None
+
+
+def _shape_getter(cls, key):
+    if issubclass(cls, tuple) and hasattr(cls, '_fields'):
+        # namedtuple, indexing it with a string would always fail
+        return attrgetter(key)
+    elif _is_indexable_type(cls):
+        return itemgetter(key)
+    return attrgetter(key)
+
+
+def _get_value_for_key(key, obj, default=None):
+    if _is_indexable_type(obj.__class__):
         try:
             return obj[key]
         except (IndexError, TypeError, KeyError):
@@ -66,6 +191,28 @@ def to_marshallable_type(obj):
     return dict(obj.__dict__)
 
 
+_column_formatters = {}
+
+
+def _column_formatter(cls):
+    """Return the function used to format a column of values for fields of
+    ``cls``: its ``format_many``, unless a subclass overrides ``format``
+    below the class that provides ``format_many``."""
+    try:
+        return _column_formatters[cls]
+    except KeyError:
+        pass
+    formatter = Raw.format_many
+    for klass in cls.__mro__:
+        if 'format_many' in vars(klass):
+            formatter = cls.format_many
+            break
+        if 'format' in vars(klass):
+            break
+    _column_formatters[cls] = formatter
+    return formatter
+
+
 class Raw(object):
     """Raw provides a base field class from which others should extend. It
     applies no formatting by default, and should only be used in cases where
@@ -78,7 +225,6 @@ class Raw(object):
         value, use this to retrieve a different attribute from the response
         than the publicly named value.
     """
-
     def __init__(self, default=None, attribute=None):
         self.attribute = attribute
         self.default = default
@@ -99,6 +245,19 @@ class Raw(object):
         """
         return value
 
+    def format_many(self, values):
+        """Formats a whole column of values at once, ``None`` values are
+        replaced by the default. Calls :meth:`format` for every value by
+        default - field classes can override this with a vectorized
+        version.
+
+        :param values: The list of values to format
+        :exception MarshallingException: In case of formatting problem
+        """
+        default, format = self.default, self.format
+        return [default if value is None else format(value)
+                for value in values]
+
     def output(self, key, obj):
         """Pulls the value for the given key from the object, applies the
         field's formatting and returns the result. If the key is not found
@@ -117,6 +276,51 @@ class Raw(object):
 
         return self.format(value)
 
+    def output_many(self, key, objs):
+        """Batch counterpart of :meth:`output`, returns the column of
+        formatted values for a list of objects. Falls back to calling
+        :meth:`output` per object when a subclass overrides it.
+
+        :exception MarshallingException: In case of formatting problem
+        """
+        if type(self).output is not Raw.output:
+            return [self.output(key, obj) for obj in objs]
+
+        values = get_values(
+            key if self.attribute is None else self.attribute, objs)
+        return _column_formatter(type(self))(self, values)
+
+    async def output_many_async(self, key, objs, context):
+        """Async counterpart of :meth:`output_many`, used by
+        :func:`~sanic_restful.marshal.async_marshal`: pending values are
+        awaited before being formatted. Falls back to :meth:`output_many`
+        when a subclass overrides :meth:`output`, which can't await the
+        values it reads.
+
+        :param context: the :class:`~sanic_restful.marshal.MarshalContext`
+            of the request
+        :exception MarshallingException: When a subclass overriding
+            :meth:`output` meets a pending value
+        """
+        if type(self).output not in _async_outputs:
+            values = get_values(
+                key if self.attribute is None else self.attribute, objs)
+            column = self.output_many(key, objs)
+            if any(map(is_pending, values)) or any(map(is_pending, column)):
+                raise MarshallingException(
+                    '%s overrides output and cannot await the value of %r'
+                    % (type(self).__name__, key))
+            return column
+        values = await get_values_async(
+            key if self.attribute is None else self.attribute, objs, context)
+        return await self.format_many_async(values, context)
+
+    async def format_many_async(self, values, context):
+        """Async counterpart of :meth:`format_many`, which awaits the pending
+        values first"""
+        values = await context.resolve(values)
+        return _column_formatter(type(self))(self, values)
+
 
 class Nested(Raw):
     """Allows you to nest one set of fields inside another.
@@ -134,8 +338,49 @@ class Nested(Raw):
     def __init__(self, nested, allow_null=False, **kwargs):
         self.nested = nested
         self.allow_null = allow_null
+        self._plan = None
         super().__init__(**kwargs)
 
+    @property
+    def plan(self):
+        """The nested fields compiled once into a
+        :class:`~sanic_restful.marshal.MarshalPlan`"""
+        if self._plan is None:
+            self._plan = compile_fields(self.nested)
+        return self._plan
+
+    def prune(self, tree):
+        """Return a copy of the field nesting only the fields of ``tree``,
+        see :meth:`~sanic_restful.marshal.MarshalPlan.prune`"""
+        field = copy(self)
+        field._plan = self.plan.prune(tree)
+        return field
+
+    async def format_many_async(self, values, context):
+        values = await context.resolve(values)
+        plan = self.plan
+        results, indexes, rows, pending = [], [], [], []
+        for value in values:
+            if value is None and (self.allow_null or
+                                  self.default is not None):
+                results.append(None if self.allow_null else self.default)
+                continue
+            if isinstance(value, (list, tuple)):
+                pending.append((len(results),
+                                plan.marshal_async(value, context=context)))
+            else:
+                indexes.append(len(results))
+                rows.append(value)
+            results.append(None)
+        done = await asyncio.gather(
+            plan.marshal_many_async(rows, context),
+            *[awaitable for _, awaitable in pending])
+        for index, row in zip(indexes, done[0]):
+            results[index] = row
+        for (index, _), result in zip(pending, done[1:]):
+            results[index] = result
+        return results
+
     def output(self, key, obj):
         value = get_value(key
                           if self.attribute is None else self.attribute, obj)
@@ -145,7 +390,68 @@ class Nested(Raw):
             elif self.default is not None:
                 return self.default
 
-        return marshal(value, self.nested)
+        return self.plan.marshal(value)
+
+    def encode_many(self, key, objs):
+        """Marshal the nested objects of a list of objects straight to JSON,
+        see :meth:`~sanic_restful.marshal.MarshalPlan.encode_rows`"""
+        if type(self).output is not Nested.output:
+            return [encode_json_value(self.output(key, obj)) for obj in objs]
+        values = get_values(
+            key if self.attribute is None else self.attribute, objs)
+        if not any(value is None or isinstance(value, (list, tuple))
+                   for value in values):
+            return self.plan.encode_rows(values)
+        return [self._encode(value) for value in values]
+
+    def _encode(self, value):
+        if value is None:
+            if self.allow_null:
+                return 'null'
+            elif self.default is not None:
+                return encode_json_value(self.default)
+        return self.plan.encode(value)
+
+
+class Batched(Nested):
+    """Nests objects loaded by an async batch ``loader`` from the keys found
+    in the data, so the objects referenced by a whole list are loaded with
+    a single call instead of one per object. Batched fields are only
+    marshalled by :func:`~sanic_restful.marshal.async_marshal` and
+    ``marshal_with(..., async_=True)``.
+
+    Ex::
+
+        async def load_users(ids):
+            return {user.id: user for user in await db.get_users(ids)}
+
+        fields = {
+            'title': fields.String,
+            'author': fields.Batched(user_fields, load_users,
+                                     attribute='author_id'),
+        }
+
+    Wrap it in a :class:`List` for lists of keys.
+
+    :param dict nested: The dictionary to nest the loaded objects with
+    :param loader: An async function taking a list of keys and returning the
+        list of the objects in the same order, or a dict of objects by key
+    :param kwargs: See :class:`Nested`
+    """
+    def __init__(self, nested, loader, **kwargs):
+        self.loader = loader
+        super().__init__(nested, **kwargs)
+
+    def output(self, key, obj):
+        raise MarshallingException(
+            'Batched fields can only be marshalled asynchronously')
+
+    async def format_many_async(self, values, context):
+        values = await context.resolve(values)
+        keys = [value for value in values if value is not None]
+        loaded = iter(await context.load_many(self.loader, keys))
+        objs = [None if value is None else next(loaded) for value in values]
+        return await super().format_many_async(objs, context)
 
 
 class List(Raw):
@@ -175,6 +481,21 @@ class List(Raw):
         if isinstance(value, set):
             value = list(value)
 
+        container = self.container
+        if value and isinstance(value, (list, tuple)) and \
+                container.attribute is None:
+            # Format the whole list at once when every item ends up in
+            # the container field as is
+            cls = _single_type(value)
+            output = type(container).output
+            if output is Nested.output and cls is not None and \
+                    not issubclass(cls, (list, tuple, type(None))):
+                return container.plan.marshal_many(value)
+            if output is Raw.output and (type(container) is Raw or (
+                    cls is not None and not issubclass(cls, dict))):
+                return _column_formatter(type(container))(container,
+                                                          list(value))
+
         return [
             self.container.output(
                 idx, val if (isinstance(val, dict) or
@@ -195,7 +516,48 @@ class List(Raw):
         if value is None:
             return self.default
 
-        return [marshal(value, self.container.nested)]
+        return [self.container.plan.marshal(value)]
+
+    def prune(self, tree):
+        """Return a copy of the field whose container is pruned to the
+        fields of ``tree``, see
+        :meth:`~sanic_restful.marshal.MarshalPlan.prune`"""
+        if not hasattr(self.container, 'prune'):
+            return self
+        field = copy(self)
+        field.container = self.container.prune(tree)
+        return field
+
+    async def format_many_async(self, values, context):
+        # the items of all the lists go through the container at once, so
+        # it loads them with a single call
+        values = await context.resolve(values)
+        items, spans = [], []
+        for value in values:
+            if value is None:
+                spans.append(None)
+                continue
+            if is_indexable_but_not_string(value) and \
+                    not isinstance(value, dict):
+                value = list(value)
+            else:
+                value = [value]
+            spans.append((len(items), len(items) + len(value)))
+            items.extend(value)
+        container = self.container
+        if container.attribute is None:
+            column = await container.format_many_async(items, context)
+        else:
+            items = await context.resolve(items)
+            column = await container.output_many_async(None, items, context)
+        return [self.default if span is None else column[span[0]:span[1]]
+                for span in spans]
+
+
+# The outputs that output_many_async implements, fields overriding output
+# are output synchronously
+_async_outputs = frozenset((Raw.output, Nested.output, Batched.output,
+                            List.output))
 
 
 class String(Raw):
@@ -210,6 +572,14 @@ class String(Raw):
         except ValueError as ve:
             raise MarshallingException(ve)
 
+    def format_many(self, values):
+        default = self.default
+        try:
+            return [default if value is None else str(value)
+                    for value in values]
+        except ValueError as ve:
+            raise MarshallingException(ve)
+
 
 class Integer(Raw):
     """ Field for outputting an integer value.
@@ -228,6 +598,14 @@ class Integer(Raw):
         except ValueError as ve:
             raise MarshallingException(ve)
 
+    def format_many(self, values):
+        default = self.default
+        try:
+            return [default if value is None else int(value)
+                    for value in values]
+        except ValueError as ve:
+            raise MarshallingException(ve)
+
 
 class Boolean(Raw):
     """
@@ -239,6 +617,10 @@ class Boolean(Raw):
     def format(self, value):
         return bool(value)
 
+    def format_many(self, values):
+        default = self.default
+        return [default if value is None else bool(value) for value in values]
+
 
 class FormattedString(Raw):
     """
@@ -265,14 +647,148 @@ class FormattedString(Raw):
         """
         super().__init__()
         self.src_str = str(src_str)
+        self._template = None
+
+    @property
+    def template(self):
+        """The source string parsed once, see :func:`_compile_format`"""
+        if self._template is None:
+            self._template = _compile_format(self.src_str)
+        return self._template
 
     def output(self, key, obj):
         try:
-            data = to_marshallable_type(obj)
-            return self.src_str.format(**data)
+            return self._render(self._read(obj))
         except (TypeError, IndexError) as error:
             raise MarshallingException(error)
 
+    def output_many(self, key, objs):
+        if self._by_row(objs):
+            return [self.output(key, obj) for obj in objs]
+        # only the values the string refers to are read, column by column
+        columns = [self._column(root, objs) for root in self.template[0]]
+        try:
+            if not columns:
+                return [self._render(())] * len(objs)
+            return [self._render(row) for row in zip(*columns)]
+        except (TypeError, IndexError) as error:
+            raise MarshallingException(error)
+
+    async def output_many_async(self, key, objs, context):
+        """Async counterpart of :meth:`output_many`, the pending values the
+        string refers to are awaited before it is formatted"""
+        roots = self.template[0]
+        if not objs or not roots:
+            return self.output_many(key, objs)
+        if self._by_row(objs):
+            try:
+                columns = list(zip(*[self._read(obj) for obj in objs]))
+            except (TypeError, IndexError) as error:
+                raise MarshallingException(error)
+        else:
+            columns = [self._column(root, objs) for root in roots]
+        columns = await asyncio.gather(*[context.resolve(column)
+                                         for column in columns])
+        try:
+            return [self._render(row) for row in zip(*columns)]
+        except (TypeError, IndexError) as error:
+            raise MarshallingException(error)
+
+    def _by_row(self, objs):
+        # lists mixing types, of None or of __marshallable__ objects are
+        # read object by object
+        cls = _single_type(objs) if objs else None
+        return cls is None or cls is type(None) or \
+            hasattr(cls, '__marshallable__')
+
+    def _column(self, root, objs):
+        values = get_values(root, objs)
+        if any(value is None for value in values):
+            # tell the missing values apart from the ones that are None
+            accessor = get_accessor(root)
+            for obj, value in zip(objs, values):
+                if value is None and accessor(obj, _missing) is _missing:
+                    raise KeyError(root)
+        return values
+
+    def _read(self, obj):
+        if obj is None:
+            raise TypeError('Cannot format %r without an object'
+                            % self.src_str)
+        if hasattr(obj, '__marshallable__'):
+            obj = obj.__marshallable__()
+        roots = self.template[0]
+        row = [get_value(root, obj, _missing) for root in roots]
+        for root, value in zip(roots, row):
+            if value is _missing:
+                # like str.format
+                raise KeyError(root)
+        return row
+
+    def _render(self, row):
+        roots, pieces = self.template
+        if pieces is None:
+            return self.src_str.format(**dict(zip(roots, row)))
+        parts = []
+        for literal, index, field_name, conversion, spec in pieces:
+            if literal:
+                parts.append(literal)
+            if index is None:
+                continue
+            value = row[index]
+            if field_name is not None:
+                value = _formatter.get_field(field_name, (),
+                                             {roots[index]: value})[0]
+            if conversion:
+                value = _formatter.convert_field(value, conversion)
+            parts.append(format(value, spec))
+        return ''.join(parts)
+
+
+_formatter = Formatter()
+
+# The default of the values read by FormattedString, which must exist
+_missing = object()
+
+# The name a replacement field starts with, before any attribute or index
+_FIELD_ROOT = re.compile(r'[^.\[]*')
+
+
+def _compile_format(src_str):
+    """Parse a format string into the names of the values it reads, and
+    its pieces: ``(literal, index of the value, field name, conversion,
+    format spec)`` tuples, where the field name is ``None`` when the value
+    is output as is rather than one of its attributes or items.
+
+    Pieces are ``None`` for strings with positional fields or fields nested
+    in format specs, which are formatted by :meth:`str.format` with the
+    values they read.
+    """
+    roots, pieces, compiled = [], [], True
+    for literal, field_name, spec, conversion in _formatter.parse(src_str):
+        if field_name is None:
+            pieces.append((literal, None, None, None, None))
+            continue
+        names = [field_name]
+        if '{' in spec:
+            compiled = False
+            names.extend(name for _, name, _, _ in _formatter.parse(spec)
+                         if name is not None)
+        for name in names:
+            root = _FIELD_ROOT.match(name).group()
+            if not root or root.isdigit():
+                compiled = False
+            elif root not in roots:
+                roots.append(root)
+        if compiled:
+            root = _FIELD_ROOT.match(field_name).group()
+            pieces.append((literal, roots.index(root),
+                           None if root == field_name else field_name,
+                           conversion, spec))
+    if not compiled:
+        pieces = None
+    return tuple(roots), pieces
+
 
 class Float(Raw):
     """
@@ -287,6 +803,14 @@ class Float(Raw):
         except ValueError as ve:
             raise MarshallingException(ve)
 
+    def format_many(self, values):
+        default = self.default
+        try:
+            return [default if value is None else float(value)
+                    for value in values]
+        except ValueError as ve:
+            raise MarshallingException(ve)
+
 
 class Arbitrary(Raw):
     """
@@ -328,6 +852,22 @@ class DateTime(Raw):
         except AttributeError as ae:
             raise MarshallingException(ae)
 
+    def format_many(self, values):
+        if self.dt_format == 'rfc822':
+            formatter = _rfc822
+        elif self.dt_format == 'iso8601':
+            formatter = _iso8601
+        else:
+            raise MarshallingException(
+                'Unsupported date format %s' % self.dt_format
+            )
+        default = self.default
+        try:
+            return [default if value is None else formatter(value)
+                    for value in values]
+        except AttributeError as ae:
+            raise MarshallingException(ae)
+
 
 ZERO = MyDecimal()
 
@@ -1,8 +1,559 @@
+import asyncio
 from collections import OrderedDict
-from functools import wraps
+from collections.abc import Mapping
+from functools import partial, wraps
+from inspect import isawaitable, iscoroutinefunction
+from json.encoder import encode_basestring_ascii
+from time import perf_counter
+from types import MethodType
 
-from sanic_restful import Resource
-from sanic_restful.util import unpack
+from sanic.request import Request
+from sanic_restful.metrics import phase_timer
+from sanic_restful.output import RawJSON, json_dumps
+from sanic_restful.util import (is_stream, iterate_stream, request_state,
+                                unpack)
+
+_INFINITY = float('inf')
+
+# Pruned plans cached by every plan, bounded since projections come from
+# the clients
+_PROJECTIONS_MAXSIZE = 256
+
+# Plans compiled by marshal and async_marshal, by id of their fields dict
+_PLANS_MAXSIZE = 256
+_plans = {}
+
+
+def _make(cls):
+    if isinstance(cls, type):
+        return cls()
+    return cls
+
+
+def _output_rows(field, key, objs):
+    return [field.output(key, obj) for obj in objs]
+
+
+async def _output_many_async(output_many, key, objs, context):
+    return output_many(key, objs)
+
+
+# Whether instances of a type are awaitable, see is_pending
+_awaitable_types = {}
+
+
+def is_pending(value):
+    """Whether ``value`` has to be awaited to get the actual value: an
+    awaitable (eg. a coroutine), or an async method which is called without
+    arguments"""
+    cls = value.__class__
+    try:
+        awaitable = _awaitable_types[cls]
+    except KeyError:
+        awaitable = _awaitable_types[cls] = hasattr(cls, '__await__')
+    return awaitable or (cls is MethodType and iscoroutinefunction(value))
+
+
+def _encode_json_key(key):
+    # the keys json.dumps writes, which converts the scalars to strings
+    if isinstance(key, str):
+        return encode_basestring_ascii(key)
+    return json_dumps({key: None})[1:-6]
+
+
+def encode_json_value(value):
+    """Return the JSON encoding of an already formatted value. Scalars are
+    encoded inline, anything else goes through ``json_dumps``.
+    """
+    cls = value.__class__
+    if cls is str:
+        return encode_basestring_ascii(value)
+    elif value is None:
+        return 'null'
+    elif cls is bool:
+        return 'true' if value else 'false'
+    elif cls is int:
+        return int.__repr__(value)
+    elif cls is float and value == value and \
+            value != _INFINITY and value != -_INFINITY:
+        return float.__repr__(value)
+    return json_dumps(value)
+
+
+class MarshalPlan:
+    """A fields dict compiled by :func:`compile_fields`.
+
+    Field classes are instantiated and nested dicts are compiled into
+    sub-plans ahead of time, so marshalling only has to run the prebuilt
+    ``entries`` against the data.
+
+    :param entries: ``(key, field)`` pairs, where ``field`` is either a
+        :class:`~sanic_restful.fields.Raw` instance or a nested
+        :class:`MarshalPlan`
+    """
+
+    def __init__(self, entries):
+        self.entries = tuple(entries)
+        self.keys = tuple(key for key, _ in self.entries)
+        # plans pruned by project, by projection
+        self._projections = {}
+        # the column tables and the JSON template are built on first use,
+        # marshalling single objects needs none of them
+        self._column_table = None
+        self._json_column_table = None
+        self._async_column_table = None
+        self._template = None
+
+    @property
+    def _columns(self):
+        # fields that don't implement ``output_many`` are output row by row
+        if self._column_table is None:
+            self._column_table = tuple(
+                (key, getattr(field, 'output_many', None) or
+                 partial(_output_rows, field))
+                for key, field in self.entries)
+        return self._column_table
+
+    @property
+    def _json_columns(self):
+        # fields that can encode a column to JSON themselves (nested plans
+        # and Nested fields), others are formatted then encoded value by value
+        if self._json_column_table is None:
+            self._json_column_table = tuple(
+                (key, output_many, getattr(field, 'encode_many', None))
+                for (key, field), (_, output_many) in zip(self.entries,
+                                                          self._columns))
+        return self._json_column_table
+
+    @property
+    def _async_columns(self):
+        # fields without an async column are output synchronously by
+        # marshal_many_async
+        if self._async_column_table is None:
+            self._async_column_table = tuple(
+                (key, getattr(field, 'output_many_async', None) or
+                 partial(_output_many_async, output_many))
+                for (key, field), (_, output_many) in zip(self.entries,
+                                                          self._columns))
+        return self._async_column_table
+
+    @property
+    def _json_template(self):
+        # a JSON object with the keys pre-encoded and a slot for every value
+        if self._template is None:
+            self._template = '{%s}' % ','.join(
+                '%s:%%s' % _encode_json_key(key).replace('%', '%%')
+                for key in self.keys)
+        return self._template
+
+    def project(self, projection):
+        """Return this plan pruned to the fields of ``projection``, see
+        :meth:`prune`. Pruned plans are cached by projection.
+
+        :param projection: a :class:`Projection`, a string of comma separated
+            paths or an iterable of paths, ``None`` keeps every field
+        """
+        if projection is None:
+            return self
+        projection = Projection.make(projection)
+        if not projection:
+            return self
+        key = str(projection)
+        try:
+            return self._projections[key]
+        except KeyError:
+            pass
+        plan = self.prune(projection.tree)
+        if len(self._projections) >= _PROJECTIONS_MAXSIZE:
+            self._projections.clear()
+        self._projections[key] = plan
+        return plan
+
+    def prune(self, tree):
+        """Return a plan with only the fields whose key is in ``tree``. The
+        fields nested in the plan, :class:`~sanic_restful.fields.Nested` and
+        :class:`~sanic_restful.fields.List` fields are pruned in turn, unless
+        the key maps to an empty tree.
+
+        :param tree: a dict of subtrees by key, see :attr:`Projection.tree`
+        """
+        entries = []
+        for key, field in self.entries:
+            subtree = tree.get(str(key))
+            if subtree is None:
+                continue
+            if subtree and hasattr(field, 'prune'):
+                field = field.prune(subtree)
+            entries.append((key, field))
+        return MarshalPlan(entries)
+
+    def output(self, key, obj):
+        # A nested plan marshals the same object as its parent, which lets
+        # it sit in ``entries`` next to regular fields.
+        return self.marshal_one(obj)
+
+    def output_many(self, key, objs):
+        return self.marshal_many(objs)
+
+    def marshal_one(self, obj):
+        """Marshal a single object into an :class:`OrderedDict`"""
+        return OrderedDict([(key, field.output(key, obj))
+                            for key, field in self.entries])
+
+    def marshal_many(self, objs):
+        """Marshal a list of objects column by column: every field fetches
+        and formats its values for the whole list in one go, and the rows
+        are only assembled at the end."""
+        if not self.entries:
+            return [OrderedDict() for _ in objs]
+        columns = [output_many(key, objs)
+                   for key, output_many in self._columns]
+        keys = self.keys
+        return [OrderedDict(zip(keys, row)) for row in zip(*columns)]
+
+    async def output_many_async(self, key, objs, context):
+        return await self.marshal_many_async(objs, context)
+
+    async def marshal_many_async(self, objs, context):
+        """Async counterpart of :meth:`marshal_many`: the columns of all the
+        fields are computed concurrently, awaiting the values that are
+        awaitable (see :meth:`MarshalContext.resolve`) and loading the
+        values of :class:`~sanic_restful.fields.Batched` fields, which are
+        loaded with one call per loader and nesting level.
+
+        :param context: the :class:`MarshalContext` of the request
+        """
+        if not objs or not self.entries:
+            return [OrderedDict() for _ in objs]
+        columns = await asyncio.gather(*[
+            output_many_async(key, objs, context)
+            for key, output_many_async in self._async_columns])
+        keys = self.keys
+        return [OrderedDict(zip(keys, row)) for row in zip(*columns)]
+
+    async def marshal_async(self, data, envelope=None, context=None):
+        """Async counterpart of :meth:`marshal`, see :func:`async_marshal`"""
+        if context is None:
+            context = MarshalContext()
+        data, = await context.resolve((data,))
+        if isinstance(data, (list, tuple)):
+            data = await context.resolve(data)
+            if any(isinstance(d, (list, tuple)) for d in data):
+                result = list(await asyncio.gather(*[
+                    self.marshal_async(d, context=context) for d in data]))
+            else:
+                result = await self.marshal_many_async(data, context)
+        else:
+            result = (await self.marshal_many_async((data,), context))[0]
+        return OrderedDict([(envelope, result)]) if envelope else result
+
+    def encode_many(self, key, objs):
+        return self.encode_rows(objs)
+
+    def encode_rows(self, objs):
+        """Marshal a list of objects straight to their JSON encodings, column
+        by column like :meth:`marshal_many`, without building intermediate
+        dicts"""
+        if not self._json_columns:
+            return ['{}' for _ in objs]
+        columns = []
+        for key, output_many, encode_many in self._json_columns:
+            if encode_many is None:
+                columns.append(list(map(encode_json_value,
+                                        output_many(key, objs))))
+            else:
+                columns.append(encode_many(key, objs))
+        template = self._json_template
+        return [template % row for row in zip(*columns)]
+
+    def encode(self, data):
+        """Marshal an object, or a list/tuple of objects, to a JSON string"""
+        if not isinstance(data, (list, tuple)):
+            return self.encode_rows((data,))[0]
+        if any(isinstance(d, (list, tuple)) for d in data):
+            return '[%s]' % ','.join([self.encode(d) for d in data])
+        return '[%s]' % ','.join(self.encode_rows(data))
+
+    def dump_json(self, data, envelope=None):
+        """Marshal ``data`` directly to JSON bytes, this gives the same
+        document as ``json_dumps(self.marshal(data, envelope))``: the
+        compact JSON of :mod:`json` with its default settings. It doesn't
+        follow the settings of a :class:`~sanic_restful.output.JSONBackend`,
+        other libraries or the indentation of debug mode.
+
+        :rtype: :class:`~sanic_restful.output.RawJSON`
+        """
+        document = self.encode(data)
+        if envelope:
+            document = '{%s:%s}' % (_encode_json_key(envelope), document)
+        return RawJSON(document.encode())
+
+    def marshal(self, data, envelope=None):
+        """Marshal an object, or a list/tuple of objects, with this plan.
+
+        :param envelope: optional key that will be used to envelop the
+                         serialized response
+        """
+        if isinstance(data, (list, tuple)):
+            if any(isinstance(d, (list, tuple)) for d in data):
+                result = [self.marshal(d) for d in data]
+            else:
+                result = self.marshal_many(data)
+        else:
+            result = self.marshal_one(data)
+        return OrderedDict([(envelope, result)]) if envelope else result
+
+
+class MarshalStream:
+    """An async iterable which marshals the items of ``source`` with ``plan``
+    as they arrive, so a stream of rows never has to be held in memory.
+
+    :param source: an async iterable or an iterator of objects to marshal
+    :param plan: the :class:`MarshalPlan` applied to every item
+    :param envelope: optional key that the serializer uses to envelop the
+                     streamed items
+    :param context: the :class:`MarshalContext` items are marshalled with
+                    asynchronously, if any
+    """
+
+    def __init__(self, source, plan, envelope=None, context=None):
+        self.source = source
+        self.plan = plan
+        self.envelope = envelope
+        self.context = context
+
+    async def __aiter__(self):
+        if self.context is not None:
+            plan, context = self.plan, self.context
+            async for item in iterate_stream(self.source):
+                yield await plan.marshal_async(item, context=context)
+            return
+        marshal_item = self.plan.marshal
+        async for item in iterate_stream(self.source):
+            yield marshal_item(item)
+
+
+class Projection:
+    """A sparse fieldset: the paths of the fields to output, where nested
+    fields are selected with dotted paths, eg. ``a,b,c.d``.
+
+    :param paths: an iterable of paths
+    """
+
+    def __init__(self, paths):
+        self.paths = tuple(sorted(set(paths)))
+        #: the paths as a dict of subtrees by key, an empty subtree selects
+        #: the whole field
+        self.tree = _make_tree(self.paths)
+
+    @classmethod
+    def parse(cls, value):
+        """Parse a string of comma separated paths, eg. a query parameter"""
+        return cls(path.strip() for path in value.split(',')
+                   if path.strip())
+
+    @classmethod
+    def make(cls, projection):
+        """Return ``projection`` as a :class:`Projection`, parsing strings"""
+        if isinstance(projection, Projection):
+            return projection
+        if isinstance(projection, str):
+            return cls.parse(projection)
+        return cls(projection)
+
+    def __contains__(self, key):
+        return key in self.tree
+
+    def __iter__(self):
+        return iter(self.tree)
+
+    def __bool__(self):
+        return bool(self.paths)
+
+    def __str__(self):
+        return ','.join(self.paths)
+
+    def __repr__(self):
+        return 'Projection(%r)' % str(self)
+
+
+def _make_tree(paths):
+    heads = {}
+    for path in paths:
+        head, _, rest = path.partition('.')
+        heads.setdefault(head, []).append(rest)
+    # a path to a field selects all of it, whatever the longer paths
+    return {head: {} if '' in rests else _make_tree(rests)
+            for head, rests in heads.items()}
+
+
+class BatchLoader:
+    """Collects the keys requested from an async batch ``loader`` and loads
+    them with a single call, once no more keys are being requested, then
+    caches the values by key.
+
+    ``loader(keys)`` receives a list of keys and returns the list of their
+    values in the same order, or a dict of values by key, missing keys
+    give ``None``.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.cache = {}
+        self.queue = []
+        self.calls = 0
+        self._queued = 0
+
+    def load_many(self, keys):
+        """Return an awaitable of the list of values for ``keys``"""
+        loop = asyncio.get_event_loop()
+        futures = []
+        for key in keys:
+            future = self.cache.get(key)
+            if future is None:
+                future = self.cache[key] = loop.create_future()
+                if not self.queue:
+                    loop.call_soon(self._schedule, loop)
+                self.queue.append(key)
+            futures.append(future)
+        return asyncio.gather(*futures)
+
+    def _schedule(self, loop):
+        # wait until a whole pass of the event loop queued no more keys, so
+        # concurrent fields of one level share the call
+        if len(self.queue) != self._queued:
+            self._queued = len(self.queue)
+            loop.call_soon(self._schedule, loop)
+            return
+        keys, self.queue, self._queued = self.queue, [], 0
+        asyncio.ensure_future(self._dispatch(keys))
+
+    async def _dispatch(self, keys):
+        self.calls += 1
+        try:
+            values = self.loader(keys)
+            if isawaitable(values):
+                values = await values
+            if isinstance(values, Mapping):
+                values = [values.get(key) for key in keys]
+            elif len(values) != len(keys):
+                raise ValueError('The loader returned %d values for %d keys'
+                                 % (len(values), len(keys)))
+        except Exception as exc:
+            for key in keys:
+                future = self.cache.pop(key)
+                future.set_exception(exc)
+                # other fields may have failed first, don't warn about it
+                future.exception()
+            return
+        for key, value in zip(keys, values):
+            self.cache[key].set_result(value)
+
+
+class MarshalContext:
+    """The state shared by the async marshalling of a request: a
+    :class:`BatchLoader` for every loader function, so values loaded once
+    are reused by the following fields and calls, and the bound on the
+    values awaited concurrently.
+
+    :param concurrency: the maximum number of values awaited at once
+    """
+
+    def __init__(self, concurrency=64):
+        self.loaders = {}
+        self.concurrency = concurrency
+        # the task awaiting every pending value, as several fields can read
+        # the same coroutine, which can only be awaited once
+        self.pending = {}
+        self._semaphore = None
+
+    async def resolve(self, values):
+        """Return ``values`` with the values that are pending (see
+        :func:`is_pending`) replaced by their result. They are awaited
+        concurrently, at most :attr:`concurrency` at once.
+        """
+        indexes = [index for index, value in enumerate(values)
+                   if is_pending(value)]
+        if not indexes:
+            return values
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*[self._task(values[index])
+                                         for index in indexes])
+        values = list(values)
+        for index, result in zip(indexes, results):
+            values[index] = result
+        return values
+
+    def _task(self, value):
+        try:
+            return self.pending[value]
+        except KeyError:
+            task = self.pending[value] = asyncio.ensure_future(
+                self._await(value))
+            return task
+        except TypeError:
+            # unhashable awaitable
+            return self._await(value)
+
+    async def _await(self, value):
+        async with self._semaphore:
+            if value.__class__ is MethodType:
+                value = value()
+            return await value
+
+    def load_many(self, loader, keys):
+        """Load ``keys`` with the :class:`BatchLoader` of ``loader``"""
+        try:
+            batch_loader = self.loaders[loader]
+        except KeyError:
+            batch_loader = self.loaders[loader] = BatchLoader(loader)
+        return batch_loader.load_many(keys)
+
+
+def compile_fields(fields):
+    """Compile a dict of fields into a reusable :class:`MarshalPlan`.
+
+    Compiling is idempotent, passing a :class:`MarshalPlan` returns it as is.
+    Note that the plan is a snapshot: changes made to ``fields`` after it has
+    been compiled are not picked up.
+
+    >>> from sanic_restful import fields
+    >>> plan = compile_fields({'a': fields.Raw, 'b': {'c': fields.String}})
+    >>> plan.marshal({'a': 100, 'c': 'foo'})
+    OrderedDict([('a', 100), ('b', OrderedDict([('c', 'foo')]))])
+
+    :param fields: a dict of whose keys will make up the final serialized
+                   response output
+    """
+    if isinstance(fields, MarshalPlan):
+        return fields
+    return MarshalPlan(
+        (key, compile_fields(value) if isinstance(value, dict) else
+         _make(value))
+        for key, value in fields.items())
+
+
+def _get_plan(fields):
+    """The plan of ``fields`` compiled by a previous call, or a new one. A
+    plan is reused while its fields dict is alive and holds the same
+    fields, so that the ``marshal`` calls of a module level dict compile
+    it once."""
+    if isinstance(fields, MarshalPlan):
+        return fields
+    items = list(fields.items())
+    try:
+        cached, cached_items, plan = _plans[id(fields)]
+    except KeyError:
+        pass
+    else:
+        if cached is fields and cached_items == items:
+            return plan
+    plan = compile_fields(fields)
+    if len(_plans) >= _PLANS_MAXSIZE:
+        _plans.clear()
+    _plans[id(fields)] = (fields, items, plan)
+    return plan
 
 
 def marshal(data, fields, envelope=None):
@@ -11,7 +562,8 @@ def marshal(data, fields, envelope=None):
 
     :param data: the actual object(s) from which the fields are taken from
     :param fields: a dict of whose keys will make up the final serialized
-                   response output
+                   response output, or a plan built by
+                   :func:`compile_fields`
     :param envelope: optional key that will be used to envelop the serialized
                      response
 
@@ -27,21 +579,25 @@ def marshal(data, fields, envelope=None):
     OrderedDict([('data', OrderedDict([('a', 100)]))])
 
     """
+    return _get_plan(fields).marshal(data, envelope)
 
-    def make(cls):
-        if isinstance(cls, type):
-            return cls()
-        return cls
 
-    if isinstance(data, (list, tuple)):
-        return (OrderedDict([(envelope, [marshal(d, fields) for d in data])])
-                if envelope else [marshal(d, fields) for d in data])
+async def async_marshal(data, fields, envelope=None, context=None):
+    """Async counterpart of :func:`marshal`. Values of the data which are
+    awaitable, including the results of callable attributes and async
+    methods, are awaited concurrently, and the fields that load their
+    values, eg. :class:`~sanic_restful.fields.Batched`, are loaded in
+    batches.
 
-    items = ((k, marshal(data, v)
-              if isinstance(v, dict) else make(v).output(k, data))
-             for k, v in fields.items())
-    return OrderedDict(
-        [(envelope, OrderedDict(items))]) if envelope else OrderedDict(items)
+    >>> async def count():
+    ...     return 3
+    >>> await async_marshal({'a': count()}, {'a': fields.Integer})
+    OrderedDict([('a', 3)])
+
+    :param context: the :class:`MarshalContext` caching the loaded values,
+                    a new one by default
+    """
+    return await _get_plan(fields).marshal_async(data, envelope, context)
 
 
 class marshal_with(object):
@@ -65,34 +621,171 @@ class marshal_with(object):
     >>> get()
     OrderedDict([('data', OrderedDict([('a', 100)]))])
 
+    If the method returns an async iterable or an iterator (eg. a
+    generator), every item is marshalled as it is produced and the response
+    is streamed, see :class:`MarshalStream`.
+
+    With ``direct=True`` the return value is written straight to JSON bytes
+    (see :meth:`MarshalPlan.dump_json`) instead of a tree of
+    :class:`OrderedDict`, which saves the second walk over the data when the
+    response is rendered as ``application/json``. This only applies when the
+    JSON backend of the api writes the same JSON (the :mod:`json` module
+    without settings) and the application isn't in debug mode, the data is
+    marshalled as usual otherwise.
+
+    When the resource belongs to an :class:`~sanic_restful.Api` with an
+    ``offload`` executor, large lists are marshalled in it.
+
+    With ``async_=True`` the return value is marshalled with
+    :func:`async_marshal`, sharing a :class:`MarshalContext` with the other
+    marshalling of the request: handlers can return coroutines and other
+    awaitables in the data, which are awaited concurrently.
+
+    Only a subset of the fields is output with a ``projection``, and
+    clients can ask for a sparse fieldset with the ``projection_param``
+    query parameter, eg. ``?fields=id,author.name``, see
+    :meth:`MarshalPlan.project`. The handler gets the requested
+    :class:`Projection` with :func:`get_projection`.
+
     see :meth:`flask_restful.marshal`
     """
 
-    def __init__(self, fields, envelope=None):
+    def __init__(self, fields, envelope=None, direct=False, async_=False,
+                 projection=None, projection_param=None):
         """
         :param fields: a dict of whose keys will make up the final
                        serialized response output
         :param envelope: optional key that will be used to envelop the
                         serialized response
+        :param direct: marshal straight to JSON bytes
+        :param async_: marshal asynchronously
+        :param projection: the paths of the fields to output, all of them by
+                           default
+        :param projection_param: the query parameter clients select the
+                                 fields to output with, eg. ``'fields'``
         """
         self.fields = fields
         self.envelope = envelope
+        self.direct = direct
+        self.async_ = async_
+        self.projection = projection
+        self.projection_param = projection_param
+        self.plan = compile_fields(fields)
 
     def __call__(self, f):
         @wraps(f)
         async def wrapper(*args, **kwargs):
-            _cls = args[0] if args else None
-            if isinstance(_cls, Resource):
-                pass
+            request = _find_request(args)
+            state = request_state(request) if request is not None else None
+            # set by Api.output
+            api = state.get('api') if state is not None else None
+            plan = self.plan
+            if self.projection is not None or self.projection_param:
+                plan = self._project(args)
+            direct = self.direct and _direct_json(request, api)
             resp = await f(*args, **kwargs)
+            timer = phase_timer()
+            if timer is not None:
+                start = perf_counter()
+            if self.async_:
+                marshal_data = partial(self._marshal_async,
+                                       _marshal_context(args), plan, direct)
+            else:
+                marshal_data = partial(
+                    self._offload, getattr(api, 'offloader', None), state,
+                    plan, direct)
             if isinstance(resp, tuple):
                 data, code, headers = unpack(resp)
-                return marshal(data, self.fields, self.envelope), code, headers
+                resp = await marshal_data(data), code, headers
             else:
-                return marshal(resp, self.fields, self.envelope)
+                resp = await marshal_data(resp)
+            if timer is not None:
+                timer.add('marshal', perf_counter() - start)
+            return resp
 
         return wrapper
 
+    def _project(self, args):
+        """Prune the plan to the fields of the projection, and of the one
+        requested by the client, which is kept in the request state"""
+        plan = self.plan.project(self.projection)
+        request = _find_request(args)
+        if request is None:
+            return plan
+        projection = None
+        if self.projection_param:
+            value = request.args.get(self.projection_param)
+            if value:
+                projection = Projection.parse(value)
+                plan = plan.project(projection)
+        if projection is None and self.projection is not None:
+            projection = Projection.make(self.projection)
+        request_state(request)['projection'] = projection
+        return plan
+
+    async def _offload(self, offloader, state, plan, direct, data):
+        # large lists are marshalled in the executor of the api, see
+        # sanic_restful.executor.Offloader
+        if offloader is not None and isinstance(data, (list, tuple)) and \
+                offloader.should_offload(data, state=state):
+            return await offloader.run('marshal', self._marshal, plan,
+                                       direct, data)
+        return self._marshal(plan, direct, data)
+
+    def _marshal(self, plan, direct, data):
+        if is_stream(data):
+            return MarshalStream(data, plan, self.envelope)
+        if direct:
+            return plan.dump_json(data, self.envelope)
+        return plan.marshal(data, self.envelope)
+
+    async def _marshal_async(self, context, plan, direct, data):
+        if is_stream(data):
+            return MarshalStream(data, plan, self.envelope, context)
+        result = await plan.marshal_async(data, self.envelope, context)
+        if direct:
+            return RawJSON(json_dumps(result).encode())
+        return result
+
+
+def _direct_json(request, api):
+    """Whether the JSON written by :meth:`MarshalPlan.dump_json` is the one
+    the api of the request would write"""
+    if api is None:
+        return True
+    return getattr(api.json_backend, 'matches_json_dumps', False) and \
+        not request.app.debug
+
+
+def _find_request(args):
+    """The request among the arguments of a view, if any"""
+    for arg in args[:2]:
+        if isinstance(arg, Request):
+            return arg
+    return None
+
+
+def _marshal_context(args):
+    """The :class:`MarshalContext` of the request among the arguments of a
+    view, a new one when there's no request"""
+    request = _find_request(args)
+    if request is None:
+        return MarshalContext()
+    state = request_state(request)
+    try:
+        return state['marshal_context']
+    except KeyError:
+        context = state['marshal_context'] = MarshalContext()
+        return context
+
+
+def get_projection(request):
+    """Return the :class:`Projection` requested by the client, or ``None``
+    when it didn't ask for a sparse fieldset. It is parsed by
+    :class:`marshal_with` before the handler is called, so handlers can
+    select only the columns they output."""
+    return request_state(request).get('projection')
+
 
 class marshal_with_field:
     """
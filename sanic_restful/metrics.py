@@ -0,0 +1,142 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+from sanic.response import text
+
+# The phases of a request that are timed
+PHASES = ('parse', 'handler', 'marshal', 'serialize', 'total')
+
+# Upper bounds, in seconds, of the buckets of the latency histograms
+DEFAULT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+class PhaseTimer:
+    """Accumulates the time spent in each phase of a request. The
+    :class:`~sanic_restful.Api` sets one for the task handling the request
+    when it records metrics, see :func:`phase_timer`."""
+    __slots__ = ('phases', 'start')
+
+    def __init__(self):
+        self.phases = {}
+        self.start = perf_counter()
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+# Every request is handled in a task of its own, which gets its own value
+_current_timer = ContextVar('sanic_restful_timer', default=None)
+
+
+def phase_timer():
+    """Return the :class:`PhaseTimer` of the request being handled, or
+    ``None`` when the api doesn't record metrics"""
+    return _current_timer.get()
+
+
+def start_timer():
+    """Set a new :class:`PhaseTimer` for the request being handled, and
+    return it with the token that :func:`stop_timer` takes"""
+    timer = PhaseTimer()
+    return timer, _current_timer.set(timer)
+
+
+def stop_timer(token):
+    _current_timer.reset(token)
+
+
+class Histogram:
+    """Counts observations in cumulative buckets, the way Prometheus does
+
+    :param buckets: the sorted upper bounds of the buckets, an implicit
+        ``+Inf`` bucket is added
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return ``(upper bound, count)`` pairs of the cumulative counts,
+        ending with ``+Inf``"""
+        total, result = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MetricsSink:
+    """Receives the latency of the phases of every request, see
+    :data:`PHASES`"""
+
+    def observe(self, endpoint, phase, seconds):
+        raise NotImplementedError
+
+
+class MemorySink(MetricsSink):
+    """Keeps a :class:`Histogram` per endpoint and phase in memory, the
+    default sink
+
+    :param buckets: the upper bounds of the buckets of the histograms
+    :param name: the name of the metric in the Prometheus exposition
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS,
+                 name='sanic_restful_phase_seconds'):
+        self.buckets = tuple(buckets)
+        self.name = name
+        self.histograms = {}
+
+    def observe(self, endpoint, phase, seconds):
+        try:
+            histogram = self.histograms[endpoint, phase]
+        except KeyError:
+            histogram = self.histograms[endpoint, phase] = \
+                Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def prometheus_text(self):
+        """Render the histograms in the Prometheus text exposition format"""
+        name = self.name
+        lines = [
+            '# HELP %s Time spent in each phase of a request.' % name,
+            '# TYPE %s histogram' % name,
+        ]
+        for (endpoint, phase), histogram in sorted(self.histograms.items()):
+            labels = 'endpoint="%s",phase="%s"' % (
+                _escape(endpoint), _escape(phase))
+            for bound, count in histogram.cumulative():
+                lines.append('%s_bucket{%s,le="%s"} %d' % (
+                    name, labels, _format_bound(bound), count))
+            lines.append('%s_sum{%s} %r' % (name, labels, histogram.sum))
+            lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def prometheus_view(sink):
+    """Return a view serving the metrics of ``sink`` to Prometheus, see
+    :meth:`~sanic_restful.Api.add_metrics_route`"""
+    async def metrics(request):
+        return text(sink.prometheus_text(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+    return metrics
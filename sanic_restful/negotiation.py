@@ -0,0 +1,159 @@
+from collections import OrderedDict
+from itertools import count
+
+_missing = object()
+
+
+class NegotiationCache:
+    """A bounded LRU cache of content negotiation results.
+
+    Clients only send a handful of distinct ``Accept`` headers, so the
+    negotiated media type is cached under a key made of the header and the
+    :class:`Negotiator` it was negotiated by.
+
+    :param maxsize: the number of results kept
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    def get(self, key, default=None):
+        """Return the cached result for ``key`` and count a hit, or count a
+        miss and return ``default``"""
+        try:
+            result = self._results[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._results.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def set(self, key, result):
+        self._results[key] = result
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached result, the counters are kept"""
+        self._results.clear()
+
+    def info(self):
+        """Return the ``hits``, ``misses``, ``size`` and ``maxsize`` of the
+        cache"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._results),
+            'maxsize': self.maxsize,
+        }
+
+    def __len__(self):
+        return len(self._results)
+
+
+def _split_mediatype(mediatype):
+    """Return the lowercased ``(type, subtype)`` of a media type, dropping
+    its parameters"""
+    mediatype = mediatype.split(';', 1)[0].strip().lower()
+    if mediatype == '*':
+        return '*', '*'
+    main, _, sub = mediatype.partition('/')
+    return main, sub or '*'
+
+
+def parse_accept(accept):
+    """Parse an ``Accept`` header into the q-values of its media ranges,
+    indexed by specificity: ``(exact, types, wildcard)`` where ``exact`` maps
+    ``(type, subtype)`` and ``types`` maps ``type`` (for ``type/*`` ranges) to
+    their q-value, and ``wildcard`` is the q-value of ``*/*`` or ``None``.
+    Malformed ranges are skipped.
+    """
+    exact, types, wildcard = {}, {}, None
+    for media_range in accept.split(','):
+        mediatype, *params = media_range.split(';')
+        if not mediatype.strip():
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    quality = None
+                break
+        if quality is None:
+            continue
+        main, sub = _split_mediatype(mediatype)
+        if main == '*':
+            wildcard = max(quality, wildcard or 0.0)
+        elif sub == '*':
+            types[main] = max(quality, types.get(main, 0.0))
+        else:
+            exact[main, sub] = max(quality, exact.get((main, sub), 0.0))
+    return exact, types, wildcard
+
+
+class Negotiator:
+    """Selects which of a set of media types to respond with, following the
+    q-value rules of RFC 7231 section 5.3.2: every media type gets the
+    q-value of the most specific range of the ``Accept`` header that matches
+    it, the one with the highest q-value wins and ties go to the first media
+    type of the set.
+
+    The media types are parsed once, and results are cached by ``Accept``
+    header when a :class:`NegotiationCache` is given.
+
+    :param mediatypes: the media types that can be responded with, in order
+        of preference
+    :param cache: an optional :class:`NegotiationCache`, which may be shared
+        between negotiators
+    """
+    _tokens = count()
+
+    def __init__(self, mediatypes, cache=None):
+        self.mediatypes = tuple(mediatypes)
+        self.cache = cache
+        # distinguishes the results of this negotiator in a shared cache
+        self.token = next(self._tokens)
+        self._parsed = tuple((mediatype, _split_mediatype(mediatype))
+                             for mediatype in self.mediatypes)
+
+    def best_match(self, accept, default=None):
+        """Return the media type that best matches the ``accept`` header,
+        or ``default`` if there is no header or nothing acceptable."""
+        if not accept or not self.mediatypes:
+            return default
+        if self.cache is None:
+            return self._best_match(accept, default)
+        key = (accept, self.token, default)
+        mediatype = self.cache.get(key, _missing)
+        if mediatype is _missing:
+            mediatype = self._best_match(accept, default)
+            self.cache.set(key, mediatype)
+        return mediatype
+
+    def _best_match(self, accept, default):
+        exact, types, wildcard = parse_accept(accept)
+        best, best_quality = default, 0.0
+        for mediatype, (main, sub) in self._parsed:
+            quality = exact.get((main, sub))
+            if quality is None:
+                quality = types.get(main, wildcard)
+            if quality is not None and quality > best_quality:
+                best, best_quality = mediatype, quality
+        return best
+
+
+def refresh_negotiator(negotiator, mediatypes):
+    """Return ``negotiator`` if it negotiates ``mediatypes``, or a new
+    :class:`Negotiator` of ``mediatypes`` sharing its cache when they have
+    changed since, eg. after a representation was assigned directly"""
+    mediatypes = tuple(mediatypes)
+    if negotiator.mediatypes == mediatypes:
+        return negotiator
+    return Negotiator(mediatypes, negotiator.cache)
@@ -1,23 +1,401 @@
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
 from functools import partial
-from json import dumps
+from json import dumps, loads
 
-from sanic.response import HTTPResponse
+from sanic.response import raw, stream
+from sanic_restful.util import is_stream, iterate_stream
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
 
 json_dumps = partial(dumps, separators=(",", ":"))
 
+# Streamed JSON is buffered up to this many bytes between writes
+STREAM_CHUNK_SIZE = 16384
+
+
+class RawJSON(bytes):
+    """JSON that has already been serialized, eg. by
+    ``marshal_with(fields, direct=True)``. :func:`output_json` writes it to
+    the response body as is, other representations receive the decoded data.
+    """
+
+    def load(self):
+        """Decode the JSON back into python objects"""
+        return loads(self)
+
+
+class JSONBackend:
+    """Serializes response data to JSON ``bytes``. A backend is resolved and
+    configured once, see :func:`get_json_backend`, and its :meth:`output`
+    method is the ``application/json`` representation of an
+    :class:`~sanic_restful.Api`.
+
+    :param settings: keyword arguments for the serializer, usually the
+        ``RESTFUL_JSON`` config of the application
+    """
+    name = None
+    # Whether dumps writes the same JSON as json_dumps, which
+    # marshal_with(direct=True) writes without the backend
+    matches_json_dumps = False
+
+    def __init__(self, settings=None):
+        self.settings = dict(settings or {})
+
+    def dumps(self, data):
+        """Serialize ``data`` to compact JSON bytes"""
+        raise NotImplementedError
+
+    def dumps_debug(self, data):
+        """Serialize ``data`` to JSON bytes when the application runs in
+        debug mode, indented unless the settings say otherwise"""
+        return self.dumps(data)
+
+    def output(self, app, data, code, headers=None):
+        if is_stream(data):
+            return output_json_stream(app, data, code, headers, backend=self)
+        if isinstance(data, RawJSON):
+            body = data
+        elif app.debug:
+            body = self.dumps_debug(data)
+        else:
+            body = self.dumps(data)
+        return raw(
+            body + b"\n",
+            headers=headers,
+            status=code,
+            content_type="application/json",
+        )
+
+    output.accepts_raw_json = True
+
+    def output_ndjson(self, app, data, code, headers=None):
+        """The ``application/x-ndjson`` representation: one JSON document
+        per line, for every item of a list or of a stream"""
+        if is_stream(data):
+            return output_ndjson_stream(app, data, code, headers,
+                                        backend=self)
+        dumps = self.dumps
+        if isinstance(data, (list, tuple)):
+            body = b''.join([dumps(item) + b'\n' for item in data])
+        else:
+            body = dumps(data) + b'\n'
+        return raw(
+            body,
+            headers=headers,
+            status=code,
+            content_type="application/x-ndjson",
+        )
+
+
+class StdlibJSONBackend(JSONBackend):
+    """The :mod:`json` module of the standard library, ``settings`` are
+    passed to :func:`json.dumps`.
+
+    :param dumper: a replacement for :func:`json.dumps`, set by the
+        ``JSON_DUMP`` key of ``RESTFUL_JSON``
+    """
+    name = 'json'
+
+    def __init__(self, settings=None, dumper=None):
+        super().__init__(settings)
+        self._dumps = partial(dumper or json_dumps, **self.settings)
+        # If we're in debug mode, and the indent is not set, we set it to a
+        # reasonable value. Note that this won't override any existing value
+        # that was set.
+        debug_settings = dict(self.settings)
+        debug_settings.setdefault('indent', 4)
+        self._dumps_debug = partial(dumper or json_dumps, **debug_settings)
+        self.matches_json_dumps = not self.settings and dumper is None
+
+    def dumps(self, data):
+        return self._dumps(data).encode()
+
+    def dumps_debug(self, data):
+        return self._dumps_debug(data).encode()
+
+
+class OrjsonBackend(JSONBackend):
+    """`orjson <https://github.com/ijl/orjson>`_, which writes ``bytes``
+    directly. Only the ``sort_keys`` and ``indent`` settings are supported,
+    any ``indent`` is rendered with two spaces.
+
+    Its output differs from that of :mod:`json`: ``NaN`` and infinities are
+    written as ``null``, integers beyond 64 bits raise ``TypeError`` and so
+    do keys other than strings, numbers, booleans, ``None``, enums and
+    dates, which are converted to strings.
+    """
+    name = 'orjson'
+
+    def __init__(self, settings=None):
+        super().__init__(settings)
+        if orjson is None:
+            raise RuntimeError('orjson is not installed')
+        unsupported = set(self.settings) - {'sort_keys', 'indent'}
+        if unsupported:
+            raise TypeError('orjson does not support the settings: %s' %
+                            ', '.join(sorted(unsupported)))
+        option = orjson.OPT_NON_STR_KEYS
+        if self.settings.get('sort_keys'):
+            option |= orjson.OPT_SORT_KEYS
+        if self.settings.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        self._option = option
+        self._debug_option = option | orjson.OPT_INDENT_2
+
+    def dumps(self, data):
+        return orjson.dumps(data, option=self._option)
+
+    def dumps_debug(self, data):
+        return orjson.dumps(data, option=self._debug_option)
+
+
+class UjsonBackend(JSONBackend):
+    """`ujson <https://github.com/ultrajson/ultrajson>`_, ``settings`` are
+    passed to :func:`ujson.dumps`.
+
+    Its output differs from that of :mod:`json`: ``NaN`` and infinities
+    raise ``OverflowError``, as do integers beyond 64 bits, and floats may
+    be written with fewer digits.
+    """
+    name = 'ujson'
+
+    def __init__(self, settings=None):
+        super().__init__(settings)
+        if ujson is None:
+            raise RuntimeError('ujson is not installed')
+        self.settings.setdefault('escape_forward_slashes', False)
+        self._dumps = partial(ujson.dumps, **self.settings)
+        debug_settings = dict(self.settings)
+        debug_settings.setdefault('indent', 4)
+        self._dumps_debug = partial(ujson.dumps, **debug_settings)
+
+    def dumps(self, data):
+        return self._dumps(data).encode()
+
+    def dumps_debug(self, data):
+        return self._dumps_debug(data).encode()
+
+
+# In order of preference when the backend is picked with ``'auto'``
+JSON_BACKENDS = OrderedDict([
+    ('orjson', OrjsonBackend),
+    ('ujson', UjsonBackend),
+    ('json', StdlibJSONBackend),
+])
+
+
+def get_json_backend(backend=None, settings=None):
+    """Resolve a :class:`JSONBackend`.
+
+    :param backend: a :class:`JSONBackend` instance, the name of one of
+        :data:`JSON_BACKENDS`, ``'auto'`` to pick the fastest installed
+        library or ``None`` for :mod:`json`. The other libraries don't
+        serialize every payload like :mod:`json` does, see their backends,
+        so they are only used when asked for. Settings other than those of
+        the standard library can't be honoured by every library, so
+        ``'auto'`` falls back to :mod:`json` when any are given.
+    :param settings: serializer settings, eg. the ``RESTFUL_JSON`` config.
+        ``JSON_DUMP`` replaces :func:`json.dumps` and implies the ``json``
+        backend.
+    """
+    if isinstance(backend, JSONBackend):
+        return backend
+    settings = dict(settings or {})
+    dumper = settings.pop('JSON_DUMP', None)
+    if dumper is not None:
+        return StdlibJSONBackend(settings, dumper=dumper)
+    if backend is None:
+        return StdlibJSONBackend(settings)
+    if backend == 'auto':
+        if settings:
+            return StdlibJSONBackend(settings)
+        if orjson is not None:
+            return OrjsonBackend()
+        if ujson is not None:
+            return UjsonBackend()
+        return StdlibJSONBackend()
+    try:
+        return JSON_BACKENDS[backend](settings)
+    except KeyError:
+        raise ValueError('Unknown JSON backend %r' % backend)
+
 
 def output_json(app, data, code, headers=None):
-    settings = app.config.get('RESTFUL_JSON', {})
-    dumps = settings.pop('JSON_DUMP', None) or json_dumps
-    # If we're in debug mode, and the indent is not set, we set it to a
-    # reasonable value here.  Note that this won't override any existing value
-    # that was set.  We also set the "sort_keys" value.
-    if app.debug:
-        settings.setdefault('indent', 4)
-
-    return HTTPResponse(
-        dumps(data, **settings) + "\n",
+    """The default ``application/json`` representation. An
+    :class:`~sanic_restful.Api` replaces it with the :meth:`JSONBackend.output`
+    of the backend it resolved at initialization, this function resolves the
+    backend from the config of ``app`` on every call.
+    """
+    backend = get_json_backend(
+        app.config.get('RESTFUL_JSON_BACKEND'),
+        app.config.get('RESTFUL_JSON'))
+    return backend.output(app, data, code, headers)
+
+
+output_json.accepts_raw_json = True
+
+
+def output_ndjson(app, data, code, headers=None):
+    """The default ``application/x-ndjson`` representation, see
+    :meth:`JSONBackend.output_ndjson`. Like :func:`output_json`, an
+    :class:`~sanic_restful.Api` replaces it with the method of its backend.
+    """
+    backend = get_json_backend(
+        app.config.get('RESTFUL_JSON_BACKEND'),
+        app.config.get('RESTFUL_JSON'))
+    return backend.output_ndjson(app, data, code, headers)
+
+
+def _stream_response(chunks, code, headers, content_type):
+    """Stream the bytes produced by the async iterable ``chunks``, buffered
+    up to :data:`STREAM_CHUNK_SIZE` between writes"""
+    async def streaming_fn(response):
+        buffer, size = [], 0
+        async for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= STREAM_CHUNK_SIZE:
+                await response.write(b''.join(buffer))
+                buffer, size = [], 0
+        if buffer:
+            await response.write(b''.join(buffer))
+
+    return stream(
+        streaming_fn,
+        status=code,
         headers=headers,
-        status=200,
-        content_type="application/json",
+        content_type=content_type,
     )
+
+
+def output_json_stream(app, data, code, headers=None, backend=None):
+    """Streams an async iterable or an iterator as a chunked JSON array,
+    serializing every item as it arrives. If ``data`` has an ``envelope``
+    (see :class:`~sanic_restful.marshal.MarshalStream`) the array is wrapped
+    in an object under that key.
+    """
+    if backend is None:
+        backend = get_json_backend(
+            app.config.get('RESTFUL_JSON_BACKEND'),
+            app.config.get('RESTFUL_JSON'))
+    dumps = backend.dumps
+    envelope = getattr(data, 'envelope', None)
+    if envelope:
+        opening, closing = b'{' + dumps(envelope) + b':[', b']}\n'
+    else:
+        opening, closing = b'[', b']\n'
+
+    async def chunks():
+        yield opening
+        separator = b''
+        async for item in iterate_stream(data):
+            yield separator + dumps(item)
+            separator = b','
+        yield closing
+
+    return _stream_response(chunks(), code, headers, "application/json")
+
+
+def output_ndjson_stream(app, data, code, headers=None, backend=None):
+    """Streams an async iterable or an iterator as newline delimited JSON,
+    one line per item as it arrives. Envelopes are ignored."""
+    if backend is None:
+        backend = get_json_backend(
+            app.config.get('RESTFUL_JSON_BACKEND'),
+            app.config.get('RESTFUL_JSON'))
+    dumps = backend.dumps
+
+    async def chunks():
+        async for item in iterate_stream(data):
+            yield dumps(item) + b'\n'
+
+    return _stream_response(chunks(), code, headers, "application/x-ndjson")
+
+
+def encode_binary_value(value):
+    """Encode the values that the binary representations can't hold the way
+    the fields would: :class:`~decimal.Decimal` as a string, like
+    :class:`~sanic_restful.fields.Fixed`, and :class:`~datetime.datetime` in
+    RFC 822, like :class:`~sanic_restful.fields.DateTime`.
+    """
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        from sanic_restful.fields import _rfc822
+        return _rfc822(value)
+    raise TypeError('Object of type %s is not serializable' %
+                    type(value).__name__)
+
+
+def _field_values(data):
+    # cbor2 has tags of its own for decimals and datetimes, which are
+    # replaced ahead of encoding
+    if isinstance(data, dict):
+        return {key: _field_values(value) for key, value in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return [_field_values(value) for value in data]
+    elif isinstance(data, (Decimal, datetime)):
+        return encode_binary_value(data)
+    return data
+
+
+def msgpack_dumps(data):
+    """Serialize ``data`` to MessagePack bytes"""
+    return msgpack.packb(data, default=encode_binary_value,
+                         use_bin_type=True)
+
+
+def cbor_dumps(data):
+    """Serialize ``data`` to CBOR bytes"""
+    return cbor2.dumps(_field_values(data))
+
+
+def _binary_output(dumps, content_type):
+    def output(app, data, code, headers=None):
+        if is_stream(data):
+            # a sequence of encoded items, which both formats can decode
+            # one after the other
+            async def chunks():
+                async for item in iterate_stream(data):
+                    yield dumps(item)
+
+            return _stream_response(chunks(), code, headers, content_type)
+        return raw(dumps(data), status=code, headers=headers,
+                   content_type=content_type)
+
+    output.__name__ = 'output_' + content_type.rpartition('/')[2]
+    output.__doc__ = """The ``%s`` representation, streams are sent as
+    a sequence of encoded items.""" % content_type
+    return output
+
+
+output_msgpack = _binary_output(msgpack_dumps, 'application/msgpack')
+output_cbor = _binary_output(cbor_dumps, 'application/cbor')
+
+# The binary representations of the libraries that are installed, added to
+# the default representations of an Api
+BINARY_REPRESENTATIONS = []
+if msgpack is not None:  # pragma: no cover
+    BINARY_REPRESENTATIONS.append(('application/msgpack', output_msgpack))
+if cbor2 is not None:  # pragma: no cover
+    BINARY_REPRESENTATIONS.append(('application/cbor', output_cbor))
@@ -1,11 +1,15 @@
 import collections
 from copy import deepcopy
 import decimal
+from time import perf_counter
+from types import SimpleNamespace
 
 from sanic.exceptions import abort, InvalidUsage
 from sanic.request import Request
 from werkzeug.datastructures import MultiDict as RequestParameters
 
+from sanic_restful.metrics import phase_timer
+
 
 # class RequestParameters(collections.UserDict):
 #     """Hosts a dict with lists as values where get returns the first
@@ -45,6 +49,20 @@ _friendly_location = {
 }
 
 
+def _location_value(request, location, sources):
+    """Read a location off the request, once per ``sources`` cache"""
+    key = ('location', location)
+    try:
+        return sources[key]
+    except KeyError:
+        pass
+    value = getattr(request, location, None)
+    if callable(value):
+        value = value()
+    sources[key] = value
+    return value
+
+
 class Argument(object):
 
     """
@@ -114,7 +132,7 @@ class Argument(object):
         self.nullable = nullable
         self.ignore_invalid_usage = ignore_invalid_usage
 
-    def source(self, request):
+    def source(self, request, sources=None):
         """Pulls values off the request in the provided location
         if location is str:
             json -> dict
@@ -123,32 +141,53 @@ class Argument(object):
             return RequestParameters
 
         :param request: The flask request object to parse arguments from
+        :param sources: An optional dict caching the values resolved from
+            the request, shared by all the arguments parsed from a request
+            so that every location is read and merged at most once
         """
+        if sources is None:
+            sources = {}
+        # a location that can't be read only falls back to empty parameters
+        # for the arguments ignoring invalid usage
+        key = (self.location, self.ignore_invalid_usage)
+        try:
+            return sources[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # an unhashable location, eg. a list, is not cached
+            return self._source(request, sources)
+        value = sources[key] = self._source(request, sources)
+        return value
+
+    def _source(self, request, sources):
         if isinstance(self.location, str):
             try:
-                value = getattr(request, self.location, RequestParameters())
+                value = _location_value(request, self.location, sources)
             except InvalidUsage as e:
                 if self.ignore_invalid_usage:
                     return RequestParameters()
                 else:
                     raise e
 
-            if callable(value):
-                value = value()
             if value:
                 return value
         else:
             values = RequestParameters()
             for l in self.location:
-                value = getattr(request, l, None)
-                if callable(value):
-                    value = value()
+                value = _location_value(request, l, sources)
                 if value:
                     values.update(value)
             return values
 
         return RequestParameters()
 
+    @property
+    def lookups(self):
+        """The ``(operator, name)`` pairs looked up in the source"""
+        return [(operator, self.name + operator.replace("=", "", 1))
+                for operator in self.operators]
+
     def convert(self, value, op):
         if self.location == "file":
             return value
@@ -187,7 +226,8 @@ class Argument(object):
             return error, msg
         abort(400, message=msg)
 
-    def parse(self, request, req_temp, bundle_errors=False):
+    def parse(self, request, req_temp, bundle_errors=False, sources=None,
+              lookups=None):
         """Parses argument value(s) from the request, converting according to
         the argument's type.
 
@@ -195,8 +235,11 @@ class Argument(object):
         :param do not abort when first error occurs, return a
             dict with the name of the argument and the error message to be
             bundled
+        :param sources: The values already resolved from the request, see
+            :meth:`source`
+        :param lookups: The precompiled :attr:`lookups` of this argument
         """
-        source = self.source(request)
+        source = self.source(request, sources)
 
         results = []
 
@@ -204,8 +247,7 @@ class Argument(object):
         _not_found = False
         _found = True
 
-        for operator in self.operators:
-            name = self.name + operator.replace("=", "", 1)
+        for operator, name in lookups or self.lookups:
             if name in source:
                 # Account for MultiDict and regular dict
                 if hasattr(source, "getlist"):
@@ -310,6 +352,16 @@ class RequestParser:
         self.namespace_cls = namespace_cls
         self.trim = trim
         self.bundle_errors = bundle_errors
+        self._plan = None
+
+    @property
+    def plan(self):
+        """The precompiled ``(name, argument, lookups)`` entries that
+        :meth:`parse_args` runs, rebuilt whenever the arguments change"""
+        if self._plan is None:
+            self._plan = tuple((name, arg, arg.lookups)
+                               for name, arg in self.args.items())
+        return self._plan
 
     def add_argument(self, *args, **kwargs) -> None:
         """Adds an argument to be parsed.
@@ -333,6 +385,7 @@ class RequestParser:
             raise RuntimeError('Argument is existed')
         else:
             self.args[argument_obj.name] = argument_obj
+            self._plan = None
 
     def parse_args(self, request: Request, strict=False):
         """Parse all arguments from the provided request and return the results
@@ -341,17 +394,29 @@ class RequestParser:
         :param strict: if req includes args not in parser,
                 throw 400 BadRequest exception
         """
+        timer = phase_timer()
+        if timer is None:
+            return self._parse_args(request, strict)
+        start = perf_counter()
+        try:
+            return self._parse_args(request, strict)
+        finally:
+            timer.add('parse', perf_counter() - start)
+
+    def _parse_args(self, request, strict):
         namespace = self.namespace_cls()
+        # Values resolved from the request, shared by all the arguments
+        sources = {}
 
         # A record of arguments not yet parsed; as each is found
         # among self.args, it will be popped out
-        req_temp = collections.namedtuple('RedType', 'unparsed_arguments')
-        req_temp.unparsed_arguments = dict(
-            self.argument_cls('').source(request)) if strict else {}
+        req_temp = SimpleNamespace(unparsed_arguments=dict(
+            self.argument_cls('').source(request, sources)) if strict else {})
         errors = {}
 
-        for name, arg in self.args.items():
-            value, found = arg.parse(request, req_temp, self.bundle_errors)
+        for name, arg, lookups in self.plan:
+            value, found = arg.parse(request, req_temp, self.bundle_errors,
+                                     sources, lookups)
             if isinstance(value, ValueError):
                 errors.update(found)
                 found = None
@@ -384,8 +449,10 @@ class RequestParser:
         new_args = self.argument_cls(name, *args, **kwargs)
         if self.args.get(name):
             self.args[name] = new_args
+            self._plan = None
         else:
             raise AttributeError('%s not existed' % name)
 
     def remove_argument(self, name):
         self.args.pop(name)
+        self._plan = None
@@ -1,74 +1,278 @@
-from collections import OrderedDict, Mapping, Sequence
+from collections import OrderedDict, deque
+from collections.abc import Mapping, Sequence
+from functools import wraps
+from inspect import isawaitable, iscoroutinefunction
+from types import MappingProxyType
 
 from sanic.request import Request
 from sanic.response import BaseHTTPResponse
 from sanic.views import HTTPMethodView
-from sanic_restful.util import best_match_accept_mimetype, unpack
+from sanic_restful.conditional import etag_matches, not_modified, quote_etag
+from sanic_restful.negotiation import refresh_negotiator
+from sanic_restful.output import RawJSON
+from sanic_restful.util import (
+    best_match_accept_mimetype, request_state, unpack)
+
+
+def _resource_handler(func):
+    """Adapt a handler method so that ``method_decorators`` can be applied
+    to it once for the class: the resource instance is looked up in the
+    state of the request, set by :meth:`Resource.dispatch_request`, unless
+    :meth:`Resource.short_circuit` answers the request. Synchronous methods
+    are called on the event loop, or in the pool selected by
+    :func:`~sanic_restful.executor.run_in_executor`."""
+    is_async = iscoroutinefunction(func)
+
+    @wraps(func)
+    async def handler(request, *args, **kwargs):
+        state = request_state(request)
+        resource = state['resource']
+        if resource.cache is not None or resource.etag is not None or \
+                resource.coalesce is not None:
+            resp = await resource.short_circuit(request, *args, **kwargs)
+            if resp is not None:
+                return resp
+        if is_async:
+            return await func(resource, request, *args, **kwargs)
+        # set by sanic_restful.executor.run_in_executor
+        pool = state.get('executor_pool')
+        if pool is not None:
+            # set by Api.output
+            api = state.get('api')
+            if api is None:
+                raise RuntimeError('%s.%s runs in the executor pool %r, '
+                                   'which needs an Api'
+                                   % (type(resource).__name__,
+                                      func.__name__, pool))
+            return await api.executor_pool(pool).run(
+                func, resource, request, *args, **kwargs)
+        resp = func(resource, request, *args, **kwargs)
+        if isawaitable(resp):
+            resp = await resp
+        return resp
+    return handler
 
 
 class Resource(HTTPMethodView):
     """
     Represents an abstract RESTful resource. Concrete resources should
     extend from this class and expose methods for each supported HTTP
-    method. If a resource is invoked with an unsupported HTTP method,
-    the API will return a response with status 405 Method Not Allowed.
+    method, coroutines or plain functions. If a resource is invoked with an
+    unsupported HTTP method, the API will return a response with status 405
+    Method Not Allowed.
     Otherwise the appropriate method is called and passed all arguments
     from the url rule used when adding the resource to an Api instance. See
     :meth:`~sanic_restful.Api.add_resource` for details.
 
+    The :class:`~sanic_restful.Api` the resource is registered with is passed
+    to the constructor, ahead of any ``resource_class_args``, and kept as
+    ``self.api`` (``self.request`` is a read-only alias of it).
+
     :param method_decorators: Mapping class; if you need use Sequence,
         use decorators attribute.
         example:
             method_decorators = {'get': login_require}
             method_decoratros = {'get': [permission, login_require]}
+        They are applied once per class, see :meth:`build_dispatch_table`.
+        Coroutines can't be decorated with
+        :func:`~sanic_restful.executor.run_in_executor`.
+    :param reuse_instance: Build a single instance of the resource when it is
+        registered and dispatch every request to it. Only for resources that
+        keep no per-request state on ``self``.
+    :param instance_pool_size: Keep up to this many idle instances around
+        and reuse them, each one serves a single request at a time. Ignored
+        when ``reuse_instance`` is set.
+    :param cache: A :class:`~sanic_restful.cache.CachePolicy` caching the
+        responses to ``GET`` requests, or a mapping of method to policy.
+        example:
+            cache = {'get': CachePolicy(ttl=30, vary=['accept-language'])}
+        Cached responses are served by the api without calling the handler,
+        see :meth:`~sanic_restful.Api.cached`.
+    :param etag: Define a method ``etag(self, request, *args, **kwargs)``,
+        which may be a coroutine, returning a version token of the resource
+        for ``GET`` requests (or ``None``). It is called after the
+        decorators and before the handler: when the ``If-None-Match``
+        header of the request matches, a ``304 Not Modified`` response is
+        sent without calling the handler, otherwise the token is sent as
+        the ``ETag`` of the response.
     """
     representations = None
+    negotiator = None
     method_decorators = {}
+    reuse_instance = False
+    instance_pool_size = 0
+    cache = None
+    etag = None
+    coalesce = None
+
+    def __init__(self, api=None, *args, **kwargs):
+        self.api = api
+
+    @property
+    def request(self):
+        """The :attr:`api` of the resource, under the name older versions
+        stored it with"""
+        return self.api
+
+    @classmethod
+    def build_dispatch_table(cls):
+        """Return an immutable mapping of HTTP method to the handler with its
+        ``method_decorators`` applied. Methods without decorators are left
+        out and called on the resource instance directly.
+        """
+        method_decorators = cls.method_decorators or {}
+        if not isinstance(method_decorators, Mapping):
+            raise TypeError("method_decorators must be Mapping")
+        table = {}
+        for method, decorators in method_decorators.items():
+            func = getattr(cls, method, None)
+            if func is None:
+                continue
+            if not isinstance(decorators, Sequence):
+                decorators = [decorators]
+            if iscoroutinefunction(func) and any(
+                    getattr(decorator, 'executor_pool', None) is not None
+                    for decorator in decorators):
+                raise TypeError('%s.%s is a coroutine, it cannot run in an '
+                                'executor pool' % (cls.__name__, method))
+            handler = _resource_handler(func)
+            for decorator in decorators:
+                handler = decorator(handler)
+            table[method] = handler
+        return MappingProxyType(table)
 
-    def __init__(self, request: Request, *args, **kwargs):
-        self.request = request
+    @classmethod
+    def get_dispatch_table(cls):
+        """The dispatch table of the class, built by :meth:`as_view` or on
+        first use"""
+        table = cls.__dict__.get('_dispatch_table')
+        if table is None:
+            table = cls._dispatch_table = cls.build_dispatch_table()
+        return table
+
+    @classmethod
+    def get_negotiator(cls):
+        """The negotiator of the :attr:`representations` of the resource,
+        rebuilt when they change, or ``None`` when the resource uses those
+        of the api"""
+        if cls.negotiator is None or not cls.representations:
+            return None
+        negotiator = cls.negotiator = refresh_negotiator(
+            cls.negotiator, cls.representations)
+        return negotiator
 
     async def dispatch_request(self, request: Request, *args, **kwargs):
         method = request.method.lower()
-        handler = getattr(self, method, None)
+        handler = self.get_dispatch_table().get(method)
+        if handler is None:
+            handler = getattr(self, method, None)
+            if self.cache is not None or self.etag is not None or \
+                    self.coalesce is not None:
+                resp = await self.short_circuit(request, *args, **kwargs)
+                if resp is not None:
+                    return resp
+        else:
+            request_state(request)['resource'] = self
 
         # if not handler and request.method == "head":
         #     handler = getattr(self, "get", None)
         # assert handler is not None, 'Unimplemented method %r' % request.method
 
-        if self.method_decorators:
-            for decorator in self.method_decorators.get(method, []):
-                handler = decorator(handler)
-
-        resp = await handler(request, *args, **kwargs)
+        resp = handler(request, *args, **kwargs)
+        if isawaitable(resp):
+            resp = await resp
         if isinstance(resp, BaseHTTPResponse):
             return resp
 
         representations = self.representations or OrderedDict()
 
-        mediatype = best_match_accept_mimetype(
-            request, representations, default=None)
+        if not representations:
+            mediatype = None
+        elif self.negotiator is not None:
+            mediatype = self.get_negotiator().best_match(
+                request.headers.get('accept', None))
+        else:
+            mediatype = best_match_accept_mimetype(
+                request, representations, default=None)
         if mediatype in representations:
             data, code, headers = unpack(resp)
-            resp = representations[mediatype](data, code, headers)
+            representation = representations[mediatype]
+            if isinstance(data, RawJSON) and not getattr(
+                    representation, 'accepts_raw_json', False):
+                data = data.load()
+            resp = representation(data, code, headers)
             resp.headers['Content-Type'] = mediatype
         return resp
 
+    async def short_circuit(self, request, *args, **kwargs):
+        """Return the response to send instead of calling the handler, or
+        ``None``: the response the api found in its cache (see
+        :attr:`cache`), a ``304 Not Modified`` response when the
+        :attr:`etag` of the resource matches the ``If-None-Match`` header
+        of the request (see :meth:`check_etag`), or the response of an
+        identical request in flight (see :attr:`coalesce`).
+        """
+        state = request_state(request)
+        if self.cache is not None:
+            cached = state.get('cached_response')
+            if cached is not None:
+                return cached
+        if self.etag is not None and request.method in ('GET', 'HEAD'):
+            resp = await self.check_etag(request, *args, **kwargs)
+            if resp is not None:
+                return resp
+        coalesce = state.get('coalesce')
+        if coalesce is not None:
+            coalescer, key, timeout = coalesce
+            return await coalescer.join(state, key, timeout)
+        return None
+
+    async def check_etag(self, request, *args, **kwargs):
+        """Return a ``304 Not Modified`` response when the :attr:`etag` of
+        the resource matches the ``If-None-Match`` header of the request,
+        otherwise keep the tag for the response and return ``None``"""
+        token = self.etag(request, *args, **kwargs)
+        if isawaitable(token):
+            token = await token
+        if token is None:
+            return None
+        etag = request_state(request)['etag'] = quote_etag(token)
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return not_modified(etag)
+        return None
+
     @classmethod
     def as_view(cls, *class_args, **class_kwargs):
         """Return view function for use with the routing system, that
         dispatches request to appropriate handler method.
         """
-        if cls.method_decorators:
-            if not isinstance(cls.method_decorators, Mapping):
-                raise TypeError("method_decorators must be Mapping")
-            for method, decorators in cls.method_decorators.items():
-                if not isinstance(decorators, Sequence):
-                    cls.method_decorators[method] = [decorators]
-
-        def view(*args, **kwargs):
-            self = view.view_class(*class_args, **class_kwargs)
-            return self.dispatch_request(*args, **kwargs)
+        cls._dispatch_table = cls.build_dispatch_table()
+
+        if cls.reuse_instance:
+            instance = cls(*class_args, **class_kwargs)
+
+            def view(*args, **kwargs):
+                return instance.dispatch_request(*args, **kwargs)
+        elif cls.instance_pool_size:
+            pool = deque()
+            pool_size = cls.instance_pool_size
+
+            async def view(*args, **kwargs):
+                try:
+                    self = pool.pop()
+                except IndexError:
+                    self = cls(*class_args, **class_kwargs)
+                try:
+                    return await self.dispatch_request(*args, **kwargs)
+                finally:
+                    if len(pool) < pool_size:
+                        pool.append(self)
+
+            view.instance_pool = pool
+        else:
+            def view(*args, **kwargs):
+                self = view.view_class(*class_args, **class_kwargs)
+                return self.dispatch_request(*args, **kwargs)
 
         if cls.decorators:
             view.__module__ = cls.__module__
@@ -1,4 +1,4 @@
-from collections import OrderedDict
+from sanic_restful.negotiation import Negotiator
 
 
 def unpack(value):
@@ -14,36 +14,41 @@ def unpack(value):
         return value, 200, {}
 
 
-def get_accept_mimetypes(request):
-    accept_types = request.headers.get('accept', None)
-    if accept_types is None:
-        return {}
-    split_types = str(accept_types).split(',')
-    # keep the order they appear!
-    return OrderedDict([((s, 1,), s,) for s in split_types])
+def request_state(request):
+    """Return the dict sanic-restful keeps its per-request state in. It
+    lives on ``request.ctx`` with Sanic versions that have it, and in the
+    request itself, which is a dict, with older ones."""
+    ctx = getattr(request, 'ctx', None)
+    if ctx is None:
+        return request.setdefault('sanic_restful', {})
+    try:
+        return ctx.sanic_restful
+    except AttributeError:
+        state = ctx.sanic_restful = {}
+        return state
+
+
+def is_stream(value):
+    """Whether ``value`` is an async iterable (eg. an async generator) or an
+    iterator (eg. a generator) whose items should be streamed rather than
+    serialized at once. Lists and other containers are not streams."""
+    return hasattr(value, '__aiter__') or hasattr(value, '__next__')
+
+
+async def iterate_stream(stream):
+    """Iterate asynchronously over the items of a stream, see
+    :func:`is_stream`"""
+    if hasattr(stream, '__aiter__'):
+        async for item in stream:
+            yield item
+    else:
+        for item in stream:
+            yield item
 
 
 def best_match_accept_mimetype(request, representations, default=None):
-    if representations is None or len(representations) < 1:
-        return default
-    try:
-        accept_mimetypes = get_accept_mimetypes(request)
-        if accept_mimetypes is None or len(accept_mimetypes) < 1:
-            return default
-        # find exact matches, in the order they appear in the `Accept:` header
-        for accept_type, qual in accept_mimetypes:
-            if accept_type in representations:
-                return accept_type
-        # match special types, like "application/json;charset=utf8" where the first half matches.
-        for accept_type, qual in accept_mimetypes:
-            type_part = str(accept_type).split(';', 1)[0]
-            if type_part in representations:
-                return type_part
-        # if _none_ of those don't match, then fallback to wildcard matching
-        for accept_type, qual in accept_mimetypes:
-            if accept_type == "*"\
-               or accept_type == "*/*"\
-               or accept_type == "*.*":
-                return default
-    except (AttributeError, KeyError):
-        return default
+    """Return the media type of ``representations`` that best matches the
+    ``Accept`` header of the request, see
+    :class:`~sanic_restful.negotiation.Negotiator`"""
+    return Negotiator(representations or ()).best_match(
+        request.headers.get('accept', None), default)
@@ -52,4 +52,10 @@ setup(
         'sanic-restful', 'pytest', 'pytest_cov', 'nose',
     ],
     # Install these with "pip install -e '.[paging]'" or '.[docs]'
+    extras_require={
+        'orjson': ['orjson'],
+        'ujson': ['ujson'],
+        'msgpack': ['msgpack'],
+        'cbor': ['cbor2'],
+    },
 )
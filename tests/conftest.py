@@ -122,6 +122,30 @@ class TestMarshal(Resource):
         return data, 200, {}
 
 
+class TestStream(Resource):
+
+    @marshal_with({'id': fields.Integer, 'name': fields.String})
+    async def get(self, request):
+        async def rows():
+            for i in range(3):
+                yield {'id': str(i), 'name': i, 'skipped': True}
+        return rows()
+
+    @marshal_with({'id': fields.Integer}, envelope='data')
+    async def post(self, request):
+        async def rows():
+            for i in range(2):
+                yield {'id': i}
+        return rows(), 201
+
+
+class TestDirect(Resource):
+
+    @marshal_with({'id': fields.Integer}, envelope='data', direct=True)
+    async def get(self, request):
+        return [{'id': '1'}, {'id': 2.0}]
+
+
 @pytest.fixture(scope="session", autouse=True)
 def app():
     sanic_app = Sanic("test")
@@ -131,4 +155,16 @@ def app():
     api.add_resource(TestResponse, '/response')
     api.add_resource(TestLogin, '/login')
     api.add_resource(TestMarshal, '/marshal')
+    api.add_resource(TestStream, '/stream')
+    api.add_resource(TestDirect, '/direct')
     yield sanic_app
+
+
+@pytest.fixture
+def make_api(request):
+    """A factory of ``(app, api)`` pairs: a Sanic application named after
+    the test and an Api for it, built with the keyword arguments"""
+    def make(**kwargs):
+        app = Sanic(request.node.name)
+        return app, Api(app, **kwargs)
+    return make
@@ -1,4 +1,8 @@
+from collections import OrderedDict
+
 from sanic import Sanic
+from sanic.response import text
+from sanic_restful import Api, Resource
 
 
 class TestAPI:
@@ -30,3 +34,86 @@ class TestAPI:
         request, response = app.test_client.get('/response')
         assert response.status == 200
         assert response.json['response'] == 'get'
+
+    def test_negotiation_cache(self):
+        app = Sanic('test_negotiation_cache')
+        api = Api(app)
+
+        class Hello(Resource):
+            async def get(self, request):
+                return {'hello': 'world'}
+
+        class Plain(Resource):
+            representations = OrderedDict(
+                [('text/plain', lambda data, code, headers: text(data))])
+
+            async def get(self, request):
+                return 'plain'
+
+        api.add_resource(Hello, '/')
+        api.add_resource(Plain, '/plain')
+        headers = {'accept': 'application/json'}
+
+        for _ in range(3):
+            _, response = app.test_client.get('/', headers=headers)
+            assert response.status == 200
+        assert api.negotiation_cache.info() == {
+            'hits': 2, 'misses': 1, 'size': 1, 'maxsize': 256}
+
+        _, response = app.test_client.get(
+            '/plain', headers={'accept': 'text/plain'})
+        assert response.text == 'plain'
+        assert api.negotiation_cache.misses == 2
+
+        @api.representation('application/xml')
+        def output_xml(app, data, code, headers=None):
+            return text('<xml/>', status=code, headers=headers)
+
+        assert len(api.negotiation_cache) == 0
+        _, response = app.test_client.get(
+            '/', headers={'accept': 'application/xml'})
+        assert response.text == '<xml/>'
+        assert response.headers['content-type'] == 'application/xml'
+
+    def test_resource_api(self):
+        api = Api()
+        resource = Resource(api)
+        assert resource.api is api
+        assert resource.request is api
+
+    def test_resource_instances(self):
+        app = Sanic('test_resource_instances')
+        api = Api(app)
+        created = []
+
+        class Counted(Resource):
+            def __init__(self, api, client):
+                super().__init__(api)
+                self.client = client
+                created.append(self)
+
+            async def get(self, request):
+                return {'instance': created.index(self), 'client': self.client}
+
+        class Shared(Counted):
+            reuse_instance = True
+
+        class Pooled(Counted):
+            instance_pool_size = 1
+
+        kwargs = {'resource_class_kwargs': {'client': 'client'}}
+        api.add_resource(Counted, '/counted', **kwargs)
+        api.add_resource(Shared, '/shared', **kwargs)
+        api.add_resource(Pooled, '/pooled', **kwargs)
+        assert len(created) == 1
+
+        for _ in range(3):
+            _, response = app.test_client.get('/shared')
+            assert response.json == {'instance': 0, 'client': 'client'}
+            _, response = app.test_client.get('/pooled')
+            assert response.json == {'instance': 1, 'client': 'client'}
+        assert len(created) == 2
+
+        _, response = app.test_client.get('/counted')
+        _, response = app.test_client.get('/counted')
+        assert response.json['instance'] == 3
@@ -0,0 +1,149 @@
+import pytest
+from sanic_restful import CachePolicy, Resource
+from sanic_restful.cache import CacheEntry, MemoryCache, RedisCache
+
+
+class FakeRedis:
+    """The subset of the redis client used by RedisCache"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in self.data if key.startswith(match[:-1])]
+
+
+def login_required(func):
+    async def wrapper(request, *args, **kwargs):
+        if request.headers.get('authorization') != 'secret':
+            return {'message': 'unauthorized'}, 401
+        return await func(request, *args, **kwargs)
+    return wrapper
+
+
+class Recorded(Resource):
+    def __init__(self, api, calls):
+        super().__init__(api)
+        self.calls = calls
+
+
+class Item(Recorded):
+    cache = {'get': CachePolicy(ttl=30, vary=['accept-language'])}
+    method_decorators = {'get': login_required}
+
+    async def get(self, request, id):
+        self.calls.append(id)
+        return {'id': id, 'call': len(self.calls)}
+
+    async def post(self, request, id):
+        self.calls.append(id)
+        return {'id': id, 'call': len(self.calls)}
+
+
+class Plain(Recorded):
+    cache = CachePolicy()
+
+    async def get(self, request):
+        self.calls.append('plain')
+        return {'call': len(self.calls)}
+
+
+@pytest.fixture
+def cached_app(make_api):
+    """A factory of applications serving the cached resources, returned
+    with their api and the calls of the handlers"""
+    def make(response_cache=None):
+        app, api = make_api(response_cache=response_cache)
+        calls = []
+        kwargs = {'resource_class_kwargs': {'calls': calls}}
+        api.add_resource(Item, '/items/<id>', **kwargs)
+        api.add_resource(Plain, '/plain', **kwargs)
+        return app, api, calls
+    return make
+
+
+class TestCache:
+
+    def test_cached_responses(self, cached_app):
+        app, api, calls = cached_app()
+        headers = {'authorization': 'secret'}
+
+        _, response = app.test_client.get('/items/1', headers=headers)
+        assert response.json == {'id': '1', 'call': 1}
+        _, response = app.test_client.get('/items/1', headers=headers)
+        assert response.status == 200
+        assert response.json == {'id': '1', 'call': 1}
+        assert response.headers['Content-Type'] == 'application/json'
+
+        # the decorators still run for cached responses
+        _, response = app.test_client.get('/items/1')
+        assert response.status == 401
+
+        # url args, query strings and vary headers are part of the key
+        _, response = app.test_client.get('/items/2', headers=headers)
+        assert response.json['call'] == 2
+        _, response = app.test_client.get('/items/1?page=2', headers=headers)
+        assert response.json['call'] == 3
+        _, response = app.test_client.get('/items/1', headers=dict(
+            headers, **{'accept-language': 'fr'}))
+        assert response.json['call'] == 4
+
+        # other methods are not cached
+        _, response = app.test_client.post('/items/1')
+        _, response = app.test_client.post('/items/1')
+        assert response.json['call'] == 6
+
+        _, response = app.test_client.get('/plain')
+        _, response = app.test_client.get('/plain')
+        assert response.json == {'call': 7}
+        # the unauthorized request found the cached response too
+        assert api.response_cache.info()['hits'] == 3
+
+    def test_redis_cache(self, cached_app):
+        redis = FakeRedis()
+        app, api, calls = cached_app(RedisCache(redis))
+        _, response = app.test_client.get('/plain')
+        _, response = app.test_client.get('/plain')
+        assert response.json == {'call': 1}
+        assert len(redis.data) == 1
+        assert all(key.startswith('sanic_restful:') for key in redis.data)
+
+        entry = CacheEntry(b'{}', 201, [('X-Foo', 'bar')], 'application/json')
+        loaded = CacheEntry.load(entry.dump())
+        assert (loaded.body, loaded.status, loaded.headers,
+                loaded.content_type) == (b'{}', 201, [('X-Foo', 'bar')],
+                                         'application/json')
+        response = loaded.to_response()
+        assert (response.body, response.status,
+                response.headers['X-Foo']) == (b'{}', 201, 'bar')
+
+    def test_memory_cache_eviction(self, monkeypatch):
+        cache = MemoryCache(maxsize=2, max_bytes=10)
+        cache.set('a', CacheEntry(b'1234'))
+        cache.set('b', CacheEntry(b'1234'))
+        assert cache.get('a') is not None
+        cache.set('c', CacheEntry(b'1234'))
+        # b was the least recently used
+        assert cache.get('b') is None
+        assert len(cache) == 2
+        cache.set('d', CacheEntry(b'12345678'))
+        assert len(cache) == 1 and cache.size == 8
+        cache.set('e', CacheEntry(b'12345678901'))
+        assert cache.get('e') is None
+
+        now = [0]
+        monkeypatch.setattr('sanic_restful.cache.monotonic', lambda: now[0])
+        cache.set('f', CacheEntry(b''), ttl=10)
+        assert cache.get('f') is not None
+        now[0] = 10
+        assert cache.get('f') is None
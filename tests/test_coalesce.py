@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from sanic_restful import Resource
+from sanic_restful.coalesce import CoalescePolicy, Coalescer
+
+
+@pytest.fixture
+def coalesced_app(make_api):
+    """A factory of applications coalescing the requests to a slow resource
+    with the given policy, returned with their api and the calls of the
+    handler"""
+    def make(coalesce):
+        app, api = make_api(coalesce=coalesce)
+        calls = []
+
+        # a class per api, which sets its coalesce policy
+        class Slow(Resource):
+            async def get(self, request, id):
+                calls.append(id)
+                call = len(calls)
+                await asyncio.sleep(0.05)
+                if id == 'error':
+                    raise ValueError('failed')
+                return {'id': id, 'call': call}
+
+        api.add_resource(Slow, '/slow/<id>')
+        return app, api, calls
+    return make
+
+
+async def gather_gets(app, *urls):
+    results = await asyncio.gather(*[app.asgi_client.get(url)
+                                     for url in urls])
+    return [response for _, response in results]
+
+
+class TestCoalesce:
+
+    def test_coalesced_requests(self, coalesced_app):
+        app, api, calls = coalesced_app(CoalescePolicy())
+
+        responses = asyncio.run(gather_gets(
+            app, '/slow/1', '/slow/1', '/slow/1', '/slow/2'))
+        # followers get the body of the leader byte for byte
+        assert responses[1].content == responses[2].content == \
+            responses[0].content == b'{"id":"1","call":1}\n'
+        assert [response.json() for response in responses] == [
+            {'id': '1', 'call': 1}] * 3 + [{'id': '2', 'call': 2}]
+        assert calls == ['1', '2']
+        assert api.coalescer.info() == {'leaders': 2, 'coalesced': 2,
+                                        'timeouts': 0, 'errors': 0,
+                                        'inflight': 0}
+
+    def test_timeout(self, coalesced_app):
+        app, api, calls = coalesced_app(CoalescePolicy(timeout=0.01))
+        responses = asyncio.run(gather_gets(app, '/slow/1', '/slow/1'))
+        assert [response.status for response in responses] == [200, 200]
+        assert calls == ['1', '1']
+        assert api.coalescer.timeouts == 1
+
+    def test_errors(self):
+        coalescer = Coalescer()
+
+        async def run():
+            leader, follower = {}, {}
+            assert await coalescer.join(leader, 'key', 1) is None
+            waiting = asyncio.ensure_future(
+                coalescer.join(follower, 'key', 1))
+            await asyncio.sleep(0)
+            coalescer.finish(leader, 'key', exception=ValueError('failed'))
+            with pytest.raises(ValueError):
+                await waiting
+
+        asyncio.run(run())
+        assert coalescer.errors == 1
+        assert coalescer.inflight == {}
+
+    def test_resource_without_api(self, make_api):
+        app, api = make_api(coalesce=CoalescePolicy())
+        calls = []
+
+        class Custom(Resource):
+            def __init__(self, api):
+                pass
+
+            async def get(self, request):
+                calls.append(1)
+                await asyncio.sleep(0.05)
+                return {'calls': len(calls)}
+
+        api.add_resource(Custom, '/')
+        responses = asyncio.run(gather_gets(app, '/', '/'))
+        assert [response.json() for response in responses] == \
+            [{'calls': 1}] * 2
+        assert api.coalescer.coalesced == 1
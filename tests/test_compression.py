@@ -0,0 +1,103 @@
+import gzip
+import zlib
+
+import pytest
+from sanic_restful import CachePolicy, Resource
+from sanic_restful.compression import Compressor
+
+PAYLOAD = {'items': ['item %d' % i for i in range(200)]}
+
+
+class CountingCompressor(Compressor):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def compress(self, body, encoding):
+        self.calls += 1
+        return super().compress(body, encoding)
+
+
+class Items(Resource):
+    async def get(self, request):
+        return PAYLOAD
+
+
+class Small(Resource):
+    async def get(self, request):
+        return {'a': 1}
+
+
+class Cached(Items):
+    cache = CachePolicy()
+
+
+@pytest.fixture
+def compressed_app(make_api):
+    """A factory of applications compressing their responses with the
+    given compressor"""
+    def make(compressor):
+        app, api = make_api(compression=compressor)
+        api.add_resource(Items, '/items')
+        api.add_resource(Small, '/small')
+        api.add_resource(Cached, '/cached')
+        return app
+    return make
+
+
+class TestCompression:
+
+    def test_negotiate(self):
+        compressor = Compressor()
+        assert compressor.negotiate('gzip, deflate') == 'gzip'
+        assert compressor.negotiate('deflate') == 'deflate'
+        assert compressor.negotiate('gzip;q=0.5, deflate') == 'deflate'
+        assert compressor.negotiate('*') == 'gzip'
+        assert compressor.negotiate('*, gzip;q=0') == 'deflate'
+        assert compressor.negotiate('br') is None
+        assert compressor.negotiate(None) is None
+
+    def test_compressed_responses(self, compressed_app):
+        compressor = CountingCompressor()
+        app = compressed_app(compressor)
+        client = app.test_client
+
+        _, response = client.get('/items', headers={
+            'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert response.json == PAYLOAD
+
+        _, response = client.get('/items', headers={
+            'Accept-Encoding': 'identity'})
+        assert 'Content-Encoding' not in response.headers
+        assert response.json == PAYLOAD
+
+        _, response = client.get('/small', headers={
+            'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+        assert compressor.calls == 1
+
+        # compressed variants are cached
+        for _ in range(3):
+            _, response = client.get('/cached', headers={
+                'Accept-Encoding': 'gzip'})
+            assert response.headers['Content-Encoding'] == 'gzip'
+        assert compressor.calls == 2
+
+    def test_compress_in_executor(self, compressed_app):
+        compressor = Compressor(encodings=('gzip',), executor_threshold=0)
+        app = compressed_app(compressor)
+        _, response = app.test_client.get('/items', headers={
+            'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.json == PAYLOAD
+
+    def test_compress(self):
+        compressor = Compressor(level=1)
+        body = b'x' * 1000
+        assert gzip.decompress(compressor.compress(body, 'gzip')) == body
+        assert zlib.decompress(compressor.compress(body, 'deflate')) == body
+        assert compressor.compress(body, 'gzip') == \
+            compressor.compress(body, 'gzip')
@@ -0,0 +1,86 @@
+from sanic import Sanic
+from sanic_restful import Api, Resource
+from sanic_restful.conditional import etag_matches, make_etag, quote_etag
+
+
+class TestConditional:
+
+    def test_etag_matches(self):
+        assert etag_matches('"a"', '"a"')
+        assert etag_matches('"b", W/"a"', '"a"')
+        assert etag_matches('"a"', 'W/"a"')
+        assert etag_matches('*', '"a"')
+        assert not etag_matches('"b"', '"a"')
+        assert not etag_matches(None, '"a"')
+        assert quote_etag(3) == '"3"'
+        assert quote_etag('W/"3"') == 'W/"3"'
+
+    def test_hashed_etag(self):
+        app = Sanic('test_hashed_etag')
+        api = Api(app, etag=True)
+
+        class Hello(Resource):
+            async def get(self, request):
+                return {'hello': 'world'}, 200, {'Cache-Control': 'max-age=5'}
+
+            async def post(self, request):
+                return {'hello': 'world'}
+
+        api.add_resource(Hello, '/')
+        _, response = app.test_client.get('/')
+        etag = response.headers['ETag']
+        assert etag == make_etag(response.body)
+
+        _, response = app.test_client.get(
+            '/', headers={'If-None-Match': etag})
+        assert response.status == 304
+        assert response.body == b''
+        assert response.headers['ETag'] == etag
+        assert response.headers['Cache-Control'] == 'max-age=5'
+
+        _, response = app.test_client.get(
+            '/', headers={'If-None-Match': '"stale"'})
+        assert response.status == 200
+        _, response = app.test_client.post('/')
+        assert 'ETag' not in response.headers
+
+    def test_resource_etag(self):
+        app = Sanic('test_resource_etag')
+        api = Api(app)
+        calls = []
+
+        def login_required(func):
+            async def wrapper(request, *args, **kwargs):
+                if request.headers.get('authorization') != 'secret':
+                    return {'message': 'unauthorized'}, 401
+                return await func(request, *args, **kwargs)
+            return wrapper
+
+        class Item(Resource):
+            async def etag(self, request, id):
+                return 'v%s' % id
+
+            async def get(self, request, id):
+                calls.append(id)
+                return {'id': id}
+
+        class Secret(Item):
+            method_decorators = {'get': login_required}
+
+        api.add_resource(Item, '/items/<id>')
+        api.add_resource(Secret, '/secret/<id>')
+
+        _, response = app.test_client.get('/items/1')
+        assert response.headers['ETag'] == '"v1"'
+        _, response = app.test_client.get(
+            '/items/1', headers={'If-None-Match': '"v1"'})
+        assert response.status == 304
+        assert calls == ['1']
+
+        headers = {'If-None-Match': '"v1"', 'authorization': 'secret'}
+        _, response = app.test_client.get('/secret/1', headers=headers)
+        assert response.status == 304
+        del headers['authorization']
+        _, response = app.test_client.get('/secret/1', headers=headers)
+        assert response.status == 401
+        assert calls == ['1']
@@ -1,4 +1,7 @@
+from functools import wraps
+
 from sanic import Sanic
+from sanic_restful import Api, Resource
 
 
 class TestDecorator:
@@ -6,3 +9,43 @@ class TestDecorator:
         _, response = app.test_client.get('/login')
         assert response.status == 200
         assert response.json['message'] == 'ok'
+
+    def test_dispatch_table(self):
+        applied = []
+
+        def tag(name):
+            def decorator(func):
+                applied.append(name)
+
+                @wraps(func)
+                async def wrapper(request, *args, **kwargs):
+                    response = await func(request, *args, **kwargs)
+                    response['tags'].append(name)
+                    return response
+                return wrapper
+            return decorator
+
+        class Tagged(Resource):
+            method_decorators = {'get': [tag('inner'), tag('outer')],
+                                 'post': tag('post')}
+
+            async def get(self, request, name):
+                return {'name': name, 'tags': [], 'api': bool(self.api)}
+
+            async def put(self, request, name):
+                return {'name': name, 'tags': []}
+
+        app = Sanic('test_dispatch_table')
+        api = Api(app)
+        api.add_resource(Tagged, '/<name>')
+        assert applied == ['inner', 'outer']
+        assert not isinstance(Tagged.method_decorators['post'], list)
+        assert set(Tagged.get_dispatch_table()) == {'get'}
+
+        for _ in range(2):
+            _, response = app.test_client.get('/foo')
+            assert response.json == {
+                'name': 'foo', 'tags': ['inner', 'outer'], 'api': True}
+        _, response = app.test_client.put('/foo')
+        assert response.json == {'name': 'foo', 'tags': []}
+        assert applied == ['inner', 'outer']
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from sanic_restful import Resource, fields, marshal_with, run_in_executor
+from sanic_restful.exceptions import ServiceUnavailable
+from sanic_restful.executor import ExecutorPool, Offloader, count_items
+
+
+class Rows(Resource):
+    @marshal_with({'id': fields.Integer})
+    async def get(self, request):
+        count = int(request.args.get('count', 1))
+        return [{'id': i, 'hidden': i} for i in range(count)]
+
+
+@pytest.fixture
+def offloaded_app(make_api):
+    """A factory of applications offloading their payloads with the given
+    offloader"""
+    def make(offloader):
+        app, api = make_api(offload=offloader, json_backend='json')
+        api.add_resource(Rows, '/rows')
+        return app
+    return make
+
+
+class TestOffloader:
+
+    def test_count_items(self):
+        assert count_items([1, 2]) == 2
+        assert count_items({'data': [1, 2, 3], 'other': [1]}) == 3
+        assert count_items({'a': 1}) == 1
+        assert count_items('text') == 1
+
+    def test_should_offload(self):
+        offloader = Offloader(min_items=10, min_bytes=100)
+        assert offloader.should_offload(list(range(10)))
+        assert not offloader.should_offload(list(range(9)))
+        assert offloader.should_offload(['x' * 20] * 5, dumps=str.encode)
+        assert not offloader.should_offload(['x' * 10] * 5, dumps=str.encode)
+        assert offloader.info()['inline'] == 0
+
+    def test_inline_count(self):
+        offloader = Offloader(min_items=10)
+        for data in ([1] * 2, {'id': 1}, [1] * 10):
+            state = {}
+            # marshalling and serializing decide for the same request
+            offloader.should_offload(data, state=state)
+            offloader.should_offload(data, state=state)
+            offloader.finish(state)
+        assert offloader.info()['inline'] == 1
+
+    def test_offloaded_responses(self, offloaded_app):
+        offloader = Offloader(min_items=3)
+        app = offloaded_app(offloader)
+
+        _, response = app.test_client.get('/rows?count=2')
+        assert response.json == [{'id': 0}, {'id': 1}]
+        assert offloader.info()['offloaded'] == {'marshal': 0, 'serialize': 0}
+
+        _, response = app.test_client.get('/rows?count=5')
+        assert response.json == [{'id': i} for i in range(5)]
+        info = offloader.info()
+        assert info['offloaded'] == {'marshal': 1, 'serialize': 1}
+        assert info['inline'] == 1
+        assert info['offloaded_seconds'] > 0
+        offloader.shutdown()
+
+    def test_process_executor(self, offloaded_app):
+        offloader = Offloader(min_items=3, process_executor=True,
+                              max_workers=1)
+        app = offloaded_app(offloader)
+        _, response = app.test_client.get('/rows?count=5')
+        assert response.json == [{'id': i} for i in range(5)]
+        assert offloader.info()['offloaded'] == {'marshal': 1, 'serialize': 1}
+        offloader.shutdown()
+
+    def test_process_errors(self):
+        offloader = Offloader(process_executor=True, max_workers=1)
+
+        async def run(func, *args):
+            return await offloader.run('serialize', func, *args,
+                                       process=True)
+
+        # the errors of the call are raised, not retried in a thread
+        with pytest.raises(TypeError):
+            asyncio.run(run(json.dumps, {1}))
+        assert offloader._executor is None
+        # calls which can't be pickled run in a thread
+        assert asyncio.run(run(lambda data: len(data), [1, 2])) == 2
+        assert offloader._executor is not None
+        assert offloader.info()['offloaded']['serialize'] == 1
+        offloader.shutdown()
+
+
+class TestExecutorPool:
+
+    def test_sync_handlers(self, make_api):
+        app, api = make_api(
+            executor_pools={'cpu': ExecutorPool(max_workers=1)})
+
+        class Threads(Resource):
+            method_decorators = {'get': run_in_executor(pool='cpu')}
+
+            def get(self, request):
+                return {'thread': threading.current_thread().name}
+
+            def post(self, request):
+                return {'thread': threading.current_thread().name}, 201
+
+        api.add_resource(Threads, '/')
+        _, response = app.test_client.get('/')
+        assert response.json['thread'].startswith('sanic_restful')
+        _, response = app.test_client.post('/')
+        assert response.status == 201
+        assert response.json['thread'] == threading.current_thread().name
+        assert api.executor_pool('cpu').info()['completed'] == 1
+        api.executor_pool('cpu').shutdown()
+
+    def test_rejection(self):
+        pool = ExecutorPool(max_workers=1, max_queue=1)
+        release = threading.Event()
+
+        async def saturate():
+            blocked = [asyncio.ensure_future(pool.run(release.wait))
+                       for _ in range(2)]
+            await asyncio.sleep(0)
+            assert pool.info()['queued'] == 1
+            with pytest.raises(ServiceUnavailable):
+                await pool.run(release.wait)
+            release.set()
+            return await asyncio.gather(*blocked)
+
+        assert asyncio.run(saturate()) == [True, True]
+        assert pool.info() == {'active': 0, 'queued': 0, 'completed': 2,
+                               'rejected': 1}
+        pool.shutdown()
+
+    def test_coroutine_rejected(self):
+        class Async(Resource):
+            method_decorators = {'get': run_in_executor(pool='cpu')}
+
+            async def get(self, request):
+                return {}
+
+        with pytest.raises(TypeError):
+            Async.build_dispatch_table()
+
+    def test_rejection_status(self, make_api):
+        app, api = make_api(executor_pools={
+            'cpu': ExecutorPool(max_workers=0, max_queue=0)})
+
+        class Busy(Resource):
+            method_decorators = {'get': run_in_executor(pool='cpu')}
+
+            def get(self, request):
+                return {}
+
+        api.add_resource(Busy, '/')
+        _, response = app.test_client.get('/')
+        assert response.status == 503
+
+
+class TestResourceWithoutApi:
+
+    def test_marshal_with(self, make_api):
+        app, api = make_api(offload=Offloader(min_items=1))
+
+        class Custom(Resource):
+            def __init__(self, api, client):
+                # doesn't call Resource.__init__, so there is no self.api
+                self.client = client
+
+            @marshal_with({'client': fields.String})
+            async def get(self, request):
+                return [{'client': self.client}]
+
+        api.add_resource(Custom, '/',
+                         resource_class_kwargs={'client': 'client'})
+        _, response = app.test_client.get('/')
+        assert response.status == 200
+        assert response.json == [{'client': 'client'}]
+        assert api.offloader.info()['offloaded']['marshal'] == 1
+        api.offloader.shutdown()
+
+    def test_run_in_executor(self, make_api):
+        app, api = make_api(
+            executor_pools={'cpu': ExecutorPool(max_workers=1)})
+
+        class Custom(Resource):
+            method_decorators = {'get': run_in_executor(pool='cpu')}
+
+            def __init__(self, api):
+                pass
+
+            def get(self, request):
+                return {'thread': threading.current_thread().name}
+
+        api.add_resource(Custom, '/')
+        _, response = app.test_client.get('/')
+        assert response.status == 200
+        assert response.json['thread'].startswith('sanic_restful')
+        api.executor_pool('cpu').shutdown()
@@ -1,6 +1,16 @@
+import asyncio
+import json
 from datetime import datetime
 
-from sanic_restful import fields, marshal
+import pytest
+from sanic import Sanic
+
+from sanic_restful import (Api, Resource, async_marshal, fields, marshal,
+                           marshal_with)
+from sanic_restful.marshal import (MarshalContext, Projection, _get_plan,
+                                   _marshal_context, compile_fields,
+                                   get_projection)
+from sanic_restful.output import RawJSON, json_dumps
 
 
 address = {
@@ -56,3 +66,465 @@ class TestMarshal:
 
         _, response = app.test_client.delete(url)
         assert response.status == 200
+
+    def test_plan_reused(self):
+        mfields = {'a': fields.Raw}
+        plan = _get_plan(mfields)
+        assert _get_plan(mfields) is plan
+        assert _get_plan(dict(mfields)) is not plan
+        mfields['b'] = fields.Raw
+        assert _get_plan(mfields) is not plan
+        assert marshal({'a': 1, 'b': 2}, mfields) == {'a': 1, 'b': 2}
+
+    def test_compile_fields(self):
+        plan = compile_fields(resource_fields)
+        assert compile_fields(plan) is plan
+        data = {
+            'name': 'bot',
+            'addr1': 'fake street',
+            'address_region': {'country': 'China'},
+            'first_names': ['Emile', 'Raoul'],
+            'date_updated': datetime(2019, 1, 1),
+            'id': '01',
+        }
+        result = plan.marshal(data)
+        assert result == marshal(data, resource_fields)
+        assert list(result) == list(resource_fields)
+        assert result['address']['line 1'] == 'fake street'
+        assert result['address_region']['country'] == 'China'
+        assert result['id'] == 1
+        assert result['none_int'] == 0
+
+        assert plan.marshal([data, data], envelope='data') == {
+            'data': [result, result]}
+
+    def test_marshal_many(self):
+        class Upper(fields.String):
+            def format(self, value):
+                return str(value).upper()
+
+        mfields = {
+            'id': fields.Integer,
+            'name': Upper,
+            'score': fields.Float(default=0.5),
+            'active': fields.Boolean,
+            'created': fields.DateTime(dt_format='iso8601'),
+            'greeting': fields.FormattedString('Hi {name}'),
+            'meta': {'tag': fields.String(attribute='tag')},
+        }
+        plan = compile_fields(mfields)
+        rows = [
+            {'id': '1', 'name': 'a', 'score': 1, 'active': 1,
+             'created': datetime(2018, 1, 1), 'tag': 'x'},
+            {'id': None, 'name': 'b', 'score': None, 'active': 0,
+             'created': None, 'tag': None},
+        ]
+        result = plan.marshal_many(rows)
+        assert result == [plan.marshal_one(row) for row in rows]
+        assert marshal(rows, mfields) == result
+        assert result[0]['name'] == 'A'
+        assert result[1]['id'] == 0
+        assert result[1]['score'] == 0.5
+        assert result[1]['meta']['tag'] is None
+        assert compile_fields({}).marshal_many(rows) == [{}, {}]
+
+        with pytest.raises(fields.MarshallingException):
+            compile_fields({'id': fields.Integer}).marshal_many([{'id': 'x'}])
+
+    def test_marshal_stream(self, app):
+        _, response = app.test_client.get('/stream')
+        assert response.status == 200
+        assert response.json == [
+            {'id': 0, 'name': '0'},
+            {'id': 1, 'name': '1'},
+            {'id': 2, 'name': '2'},
+        ]
+
+        _, response = app.test_client.post('/stream')
+        assert response.status == 201
+        assert response.json == {'data': [{'id': 0}, {'id': 1}]}
+
+    def test_dump_json(self):
+        plan = compile_fields(resource_fields)
+        data = {
+            'name': 'böt "quoted"',
+            'addr1': 'fake street',
+            'address_region': {'country': 'China'},
+            'first_names': ['Emile', 'Raoul'],
+            'date_updated': datetime(2019, 1, 1),
+            'date_created': datetime(2018, 1, 1),
+            'id': '01',
+            'boolean': True,
+            'float': float('nan'),
+            'arbitrary': 1.5,
+            'fixed': 2,
+        }
+        raw = plan.dump_json(data)
+        assert isinstance(raw, RawJSON)
+        assert raw == json_dumps(marshal(data, resource_fields)).encode()
+        assert plan.dump_json([data, data], envelope='data') == json_dumps(
+            marshal([data, data], resource_fields, envelope='data')).encode()
+        assert compile_fields({}).dump_json([]) == b'[]'
+        assert compile_fields({}).dump_json({}) == b'{}'
+
+        nested = {'region': fields.Nested(address, allow_null=True)}
+        assert compile_fields(nested).dump_json({}) == b'{"region":null}'
+        keys = {True: fields.Raw, None: fields.Raw(attribute='n'),
+                1.5: fields.Raw(attribute='f')}
+        row = {True: 1, 'n': 2, 'f': 3}
+        assert compile_fields(keys).dump_json(row) == \
+            json_dumps(marshal(row, keys)).encode() == \
+            b'{"true":1,"null":2,"1.5":3}'
+        assert raw.load() == json.loads(
+            json_dumps(marshal(data, resource_fields)))
+
+    def test_marshal_direct(self, app):
+        _, response = app.test_client.get('/direct')
+        assert response.status == 200
+        assert response.json == {'data': [{'id': 1}, {'id': 2}]}
+
+    def test_marshal_direct_json_settings(self):
+        app = Sanic('direct_json_settings')
+        app.config.RESTFUL_JSON = {'ensure_ascii': False, 'sort_keys': True}
+
+        class Direct(Resource):
+            @marshal_with({'b': fields.String, 'a': fields.String},
+                          direct=True)
+            async def get(self, request):
+                return {'a': '\xe9', 'b': 'x'}
+
+        Api(app).add_resource(Direct, '/')
+        _, response = app.test_client.get('/')
+        assert response.body == '{"a":"\xe9","b":"x"}\n'.encode()
+
+    def test_get_accessor(self):
+        class Obj:
+            def __init__(self, **kwargs):
+                self.__dict__.update(kwargs)
+
+        accessor = fields.get_accessor('a.b')
+        assert fields.get_accessor('a.b') is accessor
+        assert accessor({'a': {'b': 1}}) == 1
+        assert accessor(Obj(a=Obj(b=2))) == 2
+        assert accessor({'a': Obj(b=3)}) == 3
+        assert accessor({'a': None}) is None
+        assert accessor({}, 'x') == 'x'
+        assert fields.get_accessor(1)([4, 5]) == 5
+        assert fields.get_accessor(lambda obj: obj * 2)(3) == 6
+        assert fields.get_value('a.b', {'a': {'b': 1}}) == 1
+
+    def test_get_values(self):
+        from collections import namedtuple
+        from dataclasses import dataclass
+
+        Point = namedtuple('Point', 'x y')
+
+        class Slotted:
+            __slots__ = ('x', 'y')
+
+            def __init__(self, x, y=None):
+                self.x = x
+                if y is not None:
+                    self.y = y
+
+        @dataclass
+        class Data:
+            x: int
+
+        assert fields.get_values('x', [{'x': 1}, {'x': 2}]) == [1, 2]
+        assert fields.get_values('x', [{'x': 1}, {}]) == [1, None]
+        assert fields.get_values('x', [Point(1, 2), Point(3, 4)]) == [1, 3]
+        assert fields.get_values('x', [Slotted(1), Slotted(2)]) == [1, 2]
+        assert fields.get_values('y', [Slotted(1, 2), Slotted(3)]) == [2, None]
+        assert fields.get_values('x', [Data(1), Data(2)]) == [1, 2]
+        mixed = [{'x': 1}, Point(2, 3), Slotted(4), Data(5), None]
+        assert fields.get_values('x', mixed) == [1, 2, 4, 5, None]
+        # the type changes after the first object
+        assert fields.get_values('x', [Data(1), Slotted(2), Point(3, 4),
+                                       {'x': 5}]) == [1, 2, 3, 5]
+        assert fields.get_values('a.x', [{'a': Data(1)}, {'a': None}]) == \
+            [1, None]
+        assert fields.get_values(0, [[1], [2]]) == [1, 2]
+        assert fields.get_values('x', []) == []
+
+    def test_list_format_many(self):
+        class Point:
+            __slots__ = ('x',)
+
+            def __init__(self, x):
+                self.x = x
+
+        field = fields.List(fields.Nested({'x': fields.Integer}))
+        points = [Point(1), Point(3)]
+        assert field.format(points) == [{'x': 1}, {'x': 3}]
+        assert fields.List(fields.Integer).format(['1', None, 3.0]) == \
+            [1, 0, 3]
+        assert fields.List(fields.Raw).format([{'x': 1}]) == [{'x': 1}]
+        assert fields.List(fields.String(attribute='x')).format(
+            [{'x': 1}]) == ['1']
+
+    def test_batched(self):
+        users = {1: {'name': 'ann', 'team': 10},
+                 2: {'name': 'bob', 'team': 10}}
+        teams = {10: {'name': 'core'}}
+        calls = []
+
+        async def load_users(ids):
+            calls.append(('users', ids))
+            return {id: users.get(id) for id in ids}
+
+        async def load_teams(ids):
+            calls.append(('teams', ids))
+            return [teams[id] for id in ids]
+
+        team_fields = {'name': fields.String}
+        user_fields = {
+            'name': fields.String,
+            'team': fields.Batched(team_fields, load_teams),
+        }
+        post_fields = {
+            'id': fields.Integer,
+            'author': fields.Batched(user_fields, load_users,
+                                     attribute='author_id', allow_null=True),
+            'meta': {
+                'editor': fields.Batched(user_fields, load_users,
+                                         attribute='editor_id'),
+            },
+            'readers': fields.List(fields.Batched(user_fields, load_users),
+                                   attribute='reader_ids'),
+        }
+        posts = [
+            {'id': 1, 'author_id': 1, 'editor_id': 2, 'reader_ids': [1, 2]},
+            {'id': 2, 'author_id': None, 'editor_id': 1, 'reader_ids': []},
+        ]
+        ann = {'name': 'ann', 'team': {'name': 'core'}}
+        bob = {'name': 'bob', 'team': {'name': 'core'}}
+
+        result = asyncio.run(async_marshal(posts, post_fields,
+                                           envelope='data'))
+        assert result == {'data': [
+            {'id': 1, 'author': ann, 'meta': {'editor': bob},
+             'readers': [ann, bob]},
+            {'id': 2, 'author': None, 'meta': {'editor': ann},
+             'readers': []},
+        ]}
+        # one call per loader and nesting level
+        assert calls == [('users', [1, 2]), ('teams', [10])]
+
+        with pytest.raises(fields.MarshallingException):
+            marshal(posts, post_fields)
+
+    def test_batched_errors(self):
+        async def load(ids):
+            return [None]
+
+        field = fields.List(fields.Batched({'x': fields.Raw}, load))
+        with pytest.raises(ValueError):
+            asyncio.run(async_marshal({'items': [1, 2]}, {'items': field}))
+
+    def test_marshal_with_async(self):
+        app = Sanic('test_marshal_with_async')
+        api = Api(app)
+        calls = []
+
+        async def load(ids):
+            calls.append(ids)
+            return [{'id': id} for id in ids]
+
+        item_fields = {'item': fields.Batched({'id': fields.Integer}, load)}
+
+        class Items(Resource):
+            @marshal_with(item_fields, async_=True)
+            async def get(self, request):
+                await async_marshal({'item': 1}, item_fields,
+                                    context=_marshal_context((self, request)))
+                return [{'item': 1}, {'item': 2}], 200
+
+        api.add_resource(Items, '/')
+        _, response = app.test_client.get('/')
+        assert response.json == [{'item': {'id': 1}}, {'item': {'id': 2}}]
+        # values loaded earlier in the request are reused
+        assert calls == [[1], [2]]
+
+    def test_async_marshal_awaitables(self):
+        running = []
+        peak = []
+
+        async def fetch(value):
+            running.append(value)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(value)
+            return value
+
+        class Post:
+            def __init__(self, id):
+                self.id = id
+
+            async def score(self):
+                return await fetch(self.id * 10)
+
+        post_fields = {
+            'id': fields.Integer,
+            'score': fields.Integer,
+            'title': fields.String(attribute=lambda post: fetch(
+                'post %d' % post.id)),
+            'author': fields.Nested({'name': fields.String}),
+            'author_team': fields.String(attribute='author.team'),
+            'tags': fields.List(fields.String),
+        }
+
+        def make_post(id):
+            post = Post(id)
+            post.author = fetch({'name': 'ann', 'team': 'core'})
+            post.tags = fetch([fetch('a'), 'b'])
+            return post
+
+        async def run():
+            context = MarshalContext(concurrency=4)
+            result = await async_marshal(
+                [make_post(1), fetch(make_post(2))], post_fields,
+                context=context)
+            return result
+
+        result = asyncio.run(run())
+        assert result == [
+            {'id': id, 'score': id * 10, 'title': 'post %d' % id,
+             'author': {'name': 'ann'}, 'author_team': 'core',
+             'tags': ['a', 'b']}
+            for id in (1, 2)]
+        assert max(peak) == 4
+
+        data = {'a': fetch(1), 'b': None}
+        assert asyncio.run(async_marshal(data, {'a': fields.Raw,
+                                                'b': fields.Integer})) == \
+            {'a': 1, 'b': 0}
+
+    def test_async_formatted_string(self):
+        async def fetch(value):
+            await asyncio.sleep(0)
+            return value
+
+        class User:
+            def __init__(self, name):
+                self.name = fetch(name)
+
+        greeting = {'g': fields.FormattedString('hi {name}')}
+        assert asyncio.run(async_marshal({'name': fetch('ann')}, greeting)) \
+            == {'g': 'hi ann'}
+        users = [User('ann'), User('bob')]
+        assert asyncio.run(async_marshal(users, greeting)) == [
+            {'g': 'hi ann'}, {'g': 'hi bob'}]
+        mixed = [{'name': fetch('ann')}, User('bob')]
+        assert asyncio.run(async_marshal(mixed, greeting)) == [
+            {'g': 'hi ann'}, {'g': 'hi bob'}]
+        with pytest.raises(KeyError):
+            asyncio.run(async_marshal({}, greeting))
+
+    def test_async_overridden_output(self):
+        class Upper(fields.Raw):
+            def output(self, key, obj):
+                return str(obj[key]).upper()
+
+        value = asyncio.sleep(0, 'a')
+        with pytest.raises(fields.MarshallingException):
+            asyncio.run(async_marshal({'a': value}, {'a': Upper}))
+        value.close()
+        assert asyncio.run(async_marshal({'a': 'b'}, {'a': Upper})) == \
+            {'a': 'B'}
+
+    def test_projection(self):
+        projection = Projection.parse(' name, address.city,address,id.x,')
+        assert str(projection) == 'address,address.city,id.x,name'
+        assert projection.tree == {'name': {}, 'address': {}, 'id': {'x': {}}}
+        assert 'name' in projection and 'fixed' not in projection
+
+        plan = compile_fields(resource_fields)
+        pruned = plan.project('name,address_region.city,address.line 1')
+        assert plan.project('address.line 1,address_region.city,name') \
+            is pruned
+        assert plan.project('') is plan
+        data = {'name': 'bob', 'addr1': '1', 'addr2': '2',
+                'address_region': {'country': 'x', 'city': 'y'}}
+        assert pruned.marshal(data) == {
+            'name': 'bob', 'address': {'line 1': '1'},
+            'address_region': {'city': 'y'}}
+        # the original plan is untouched
+        assert len(plan.marshal(data)) == len(resource_fields)
+
+        tags = compile_fields({
+            'tags': fields.List(fields.Nested({'id': fields.Integer,
+                                               'name': fields.String}))})
+        assert tags.project(['tags.name']).marshal(
+            {'tags': [{'id': 1, 'name': 'a'}]}) == {'tags': [{'name': 'a'}]}
+
+    def test_marshal_with_projection(self):
+        app = Sanic('test_marshal_with_projection')
+        api = Api(app)
+        seen = []
+        item_fields = {'id': fields.Integer, 'name': fields.String,
+                       'secret': fields.String,
+                       'owner': fields.Nested({'id': fields.Integer,
+                                               'name': fields.String})}
+
+        class Items(Resource):
+            @marshal_with(item_fields, projection='id,name,owner',
+                          projection_param='fields')
+            async def get(self, request):
+                seen.append(get_projection(request))
+                return [{'id': 1, 'name': 'a', 'secret': 's',
+                         'owner': {'id': 2, 'name': 'b'}}]
+
+        api.add_resource(Items, '/')
+        _, response = app.test_client.get('/')
+        assert response.json == [{'id': 1, 'name': 'a',
+                                  'owner': {'id': 2, 'name': 'b'}}]
+        _, response = app.test_client.get('/?fields=id,owner.name,secret')
+        assert response.json == [{'id': 1, 'owner': {'name': 'b'}}]
+        assert [str(projection) for projection in seen] == [
+            'id,name,owner', 'id,owner.name,secret']
+
+    def test_formatted_string(self):
+        class User:
+            def __init__(self, name, score):
+                self.name = name
+                self.score = score
+
+            @property
+            def initial(self):
+                return self.name[0]
+
+        field = fields.FormattedString(
+            '{name!r:>6}|{score:.1f}|{{x}}|{initial}|{tags[0]}')
+        assert field.template[0] == ('name', 'score', 'initial', 'tags')
+        data = {'name': 'bob', 'score': 2, 'initial': 'b', 'tags': ['t']}
+        assert field.output('key', data) == " 'bob'|2.0|{x}|b|t"
+
+        field = fields.FormattedString('{name} {score:{width}}')
+        assert field.template[1] is None
+        assert field.output('key', {'name': 'a', 'score': 1,
+                                    'width': 3}) == 'a   1'
+
+        field = fields.FormattedString('{name}: {score}')
+        users = [User('ann', 1), User('bob', 2)]
+        assert field.output_many('key', users) == ['ann: 1', 'bob: 2']
+        assert field.output_many('key', [User('ann', None)]) == \
+            ['ann: None']
+        # missing values raise like str.format, per row or column
+        with pytest.raises(KeyError):
+            field.output_many('key', [users[0], {'name': 'c'}])
+        with pytest.raises(KeyError):
+            field.output_many('key', [{'name': 'c'}, {'name': 'd'}])
+        with pytest.raises(KeyError):
+            fields.FormattedString('Hello {name}').output('key', {'x': 1})
+        assert fields.FormattedString('Hello {name}').output(
+            'key', {'name': None}) == 'Hello None'
+        assert fields.FormattedString('{initial}').output('key', users[0]) \
+            == 'a'
+        assert fields.FormattedString('plain').output_many(
+            'key', users) == ['plain', 'plain']
+
+        with pytest.raises(fields.MarshallingException):
+            fields.FormattedString('{} {name}').output('key', data)
+        with pytest.raises(fields.MarshallingException):
+            field.output('key', None)
@@ -0,0 +1,68 @@
+from sanic import Sanic
+from sanic_restful import Api, Resource, fields, marshal_with
+from sanic_restful.metrics import Histogram, MemorySink
+from sanic_restful.reqparse import RequestParser
+
+
+class TestMetrics:
+
+    def test_histogram(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        assert histogram.cumulative() == [(0.1, 2), (1.0, 3),
+                                          (float('inf'), 4)]
+        assert histogram.count == 4
+        assert histogram.sum == 2.65
+
+    def test_prometheus_text(self):
+        sink = MemorySink(buckets=(1.0,))
+        sink.observe('to"do', 'total', 0.5)
+        assert sink.prometheus_text().splitlines()[2:] == [
+            'sanic_restful_phase_seconds_bucket'
+            '{endpoint="to\\"do",phase="total",le="1.0"} 1',
+            'sanic_restful_phase_seconds_bucket'
+            '{endpoint="to\\"do",phase="total",le="+Inf"} 1',
+            'sanic_restful_phase_seconds_sum'
+            '{endpoint="to\\"do",phase="total"} 0.5',
+            'sanic_restful_phase_seconds_count'
+            '{endpoint="to\\"do",phase="total"} 1',
+        ]
+
+    def test_api_metrics(self):
+        app = Sanic('test_api_metrics')
+        api = Api(app, metrics=True)
+        parser = RequestParser()
+        parser.add_argument('name', location='args')
+
+        class Todo(Resource):
+            @marshal_with({'name': fields.String})
+            async def get(self, request):
+                return parser.parse_args(request)
+
+        class Plain(Resource):
+            async def get(self, request):
+                return {}
+
+        api.add_resource(Todo, '/todo')
+        api.add_resource(Plain, '/plain', endpoint='plain_endpoint')
+        api.add_metrics_route()
+
+        _, response = app.test_client.get('/todo?name=foo')
+        assert response.json == {'name': 'foo'}
+        app.test_client.get('/plain')
+
+        histograms = api.metrics.histograms
+        assert sorted(phase for endpoint, phase in histograms
+                      if endpoint == 'todo') == [
+            'handler', 'marshal', 'parse', 'serialize', 'total']
+        assert sorted(phase for endpoint, phase in histograms
+                      if endpoint == 'plain_endpoint') == [
+            'handler', 'serialize', 'total']
+        assert all(histogram.count == 1
+                   for histogram in histograms.values())
+
+        _, response = app.test_client.get('/metrics')
+        assert response.headers['Content-Type'].startswith('text/plain')
+        assert 'sanic_restful_phase_seconds_count{endpoint="todo",' \
+            'phase="parse"} 1' in response.text
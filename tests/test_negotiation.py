@@ -0,0 +1,96 @@
+from collections import OrderedDict
+
+from sanic import Sanic
+from sanic.response import raw
+from sanic_restful import Api, Resource
+from sanic_restful.negotiation import (
+    NegotiationCache, Negotiator, parse_accept)
+
+
+mediatypes = ['application/json', 'text/plain; charset=utf-8', 'text/html']
+
+
+class TestNegotiator:
+    def test_parse_accept(self):
+        exact, types, wildcard = parse_accept(
+            'text/html;level=1, text/*;q=0.3, */*;q=0.1, image/png;q=x')
+        assert exact == {('text', 'html'): 1.0}
+        assert types == {'text': 0.3}
+        assert wildcard == 0.1
+
+    def test_best_match(self):
+        negotiator = Negotiator(mediatypes)
+        best_match = negotiator.best_match
+        assert best_match(None, 'default') == 'default'
+        assert best_match('', 'default') == 'default'
+        assert best_match('image/png', 'default') == 'default'
+        assert best_match('text/html') == 'text/html'
+        assert best_match('application/json;charset=utf8') == \
+            'application/json'
+        assert best_match('text/plain') == 'text/plain; charset=utf-8'
+        assert best_match('*/*') == 'application/json'
+        assert best_match('*') == 'application/json'
+        assert best_match('text/*') == 'text/plain; charset=utf-8'
+        assert best_match('application/json;q=0.5, text/html') == 'text/html'
+        assert best_match('text/*, text/plain;q=0') == 'text/html'
+        assert best_match('*/*;q=0.1, text/html;q=0.2') == 'text/html'
+        assert best_match('application/json;q=0', 'default') == 'default'
+
+    def test_cache(self):
+        cache = NegotiationCache(maxsize=2)
+        json_first = Negotiator(mediatypes, cache)
+        html_first = Negotiator(reversed(mediatypes), cache)
+
+        assert json_first.best_match('*/*') == 'application/json'
+        assert html_first.best_match('*/*') == 'text/html'
+        assert json_first.best_match('*/*') == 'application/json'
+        assert cache.info() == {
+            'hits': 1, 'misses': 2, 'size': 2, 'maxsize': 2}
+
+        json_first.best_match('text/*')
+        assert len(cache) == 2
+        assert html_first.best_match('*/*') == 'text/html'
+        assert cache.misses == 4
+
+    def test_assigned_representations(self):
+        app = Sanic('test_assigned_representations')
+        api = Api(app)
+
+        def output_xml(app, data, code, headers=None):
+            return raw(b'<hello/>', status=code, headers=headers,
+                       content_type='application/xml')
+
+        def output_text(data, code, headers=None):
+            return raw(b'hello', status=code, headers=headers,
+                       content_type='text/plain')
+
+        class Hello(Resource):
+            async def get(self, request):
+                return {'hello': 'me'}
+
+        class Text(Resource):
+            representations = OrderedDict(
+                [('application/json', api.representations[
+                    'application/json'])])
+
+            async def get(self, request):
+                return {'hello': 'me'}
+
+        api.add_resource(Hello, '/hello')
+        api.add_resource(Text, '/text')
+        headers = {'Accept': 'application/xml, text/plain;q=0.5'}
+        _, response = app.test_client.get('/hello', headers=headers)
+        assert response.headers['Content-Type'] == 'application/json'
+
+        # assigned directly rather than with Api.representation
+        api.representations['application/xml'] = output_xml
+        Text.representations['text/plain'] = output_text
+        _, response = app.test_client.get('/hello', headers=headers)
+        assert response.headers['Content-Type'] == 'application/xml'
+        assert response.content == b'<hello/>'
+        _, response = app.test_client.get('/text', headers=headers)
+        assert response.content == b'hello'
+
+        del api.representations['application/xml']
+        _, response = app.test_client.get('/hello', headers=headers)
+        assert response.headers['Content-Type'] == 'application/json'
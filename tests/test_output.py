@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+import json
+
+import pytest
+from sanic import Sanic
+from sanic_restful import Api, Resource, fields, marshal_with
+from sanic_restful.output import (
+    JSONBackend, OrjsonBackend, RawJSON, StdlibJSONBackend, UjsonBackend,
+    cbor_dumps, get_json_backend, msgpack_dumps)
+
+
+payload = OrderedDict([('b', 1), ('a', [1.5, 'two', None, True])])
+
+
+class TestJSONBackend:
+    def test_stdlib(self):
+        backend = StdlibJSONBackend()
+        assert backend.dumps(payload) == b'{"b":1,"a":[1.5,"two",null,true]}'
+        assert backend.dumps_debug(payload) == json.dumps(
+            payload, indent=4, separators=(",", ":")).encode()
+
+        backend = StdlibJSONBackend({'sort_keys': True})
+        assert backend.dumps(payload).startswith(b'{"a"')
+
+    def test_custom_dumper(self):
+        settings = {'JSON_DUMP': lambda data, **kwargs: 'custom'}
+        backend = get_json_backend(None, settings)
+        assert isinstance(backend, StdlibJSONBackend)
+        assert backend.dumps(payload) == b'custom'
+        assert backend.dumps(payload) == b'custom'
+        assert 'JSON_DUMP' in settings
+
+    @pytest.mark.parametrize('backend_cls', [OrjsonBackend, UjsonBackend])
+    def test_fast_backends(self, backend_cls):
+        pytest.importorskip(backend_cls.name)
+        backend = get_json_backend(backend_cls.name)
+        assert isinstance(backend, backend_cls)
+        assert json.loads(backend.dumps(payload)) == payload
+        assert json.loads(backend.dumps_debug(payload)) == payload
+
+    def test_default_matches_stdlib(self):
+        backend = get_json_backend(None)
+        data = {1: 'a', 'big': 2 ** 70, 'nan': float('nan')}
+        assert backend.dumps(data) == json.dumps(
+            data, separators=(",", ":")).encode()
+
+    def test_orjson_non_str_keys(self):
+        pytest.importorskip('orjson')
+        backend = get_json_backend('orjson', {'sort_keys': True})
+        assert backend.dumps({1: 'a', 'b': 2}) == b'{"1":"a","b":2}'
+
+    def test_resolution(self):
+        backend = StdlibJSONBackend()
+        assert get_json_backend(backend) is backend
+        assert isinstance(get_json_backend(None), StdlibJSONBackend)
+        assert isinstance(get_json_backend('auto'), JSONBackend)
+        assert isinstance(get_json_backend(None, {'indent': 2}),
+                          StdlibJSONBackend)
+        with pytest.raises(ValueError):
+            get_json_backend('unknown')
+
+
+class TestOutputJSON:
+    def test_api_backend(self):
+        app = Sanic('test_output_json')
+        app.config.RESTFUL_JSON_BACKEND = 'json'
+        api = Api(app)
+
+        class Created(Resource):
+            async def get(self, request):
+                return {'id': 1}, 201
+
+            async def post(self, request):
+                return RawJSON(b'{"raw":true}')
+
+        api.add_resource(Created, '/')
+        assert isinstance(api.json_backend, StdlibJSONBackend)
+        assert api.representations['application/json'] == \
+            api.json_backend.output
+
+        _, response = app.test_client.get('/')
+        assert response.status == 201
+        assert response.json == {'id': 1}
+
+        _, response = app.test_client.post('/')
+        assert response.json == {'raw': True}
+
+
+class TestBinaryOutput:
+    values = {'price': Decimal('1.50'), 'when': datetime(2019, 1, 2, 3, 4)}
+    expected = {'price': '1.50', 'when': 'Wed, 02 Jan 2019 03:04:00 -0000'}
+
+    def test_msgpack(self):
+        msgpack = pytest.importorskip('msgpack')
+        assert msgpack.unpackb(msgpack_dumps(payload)) == payload
+        assert msgpack.unpackb(msgpack_dumps(self.values)) == self.expected
+
+    def test_cbor(self):
+        cbor2 = pytest.importorskip('cbor2')
+        assert cbor2.loads(cbor_dumps(payload)) == payload
+        assert cbor2.loads(cbor_dumps([self.values])) == [self.expected]
+
+    def test_api_msgpack(self):
+        msgpack = pytest.importorskip('msgpack')
+        app = Sanic('test_api_msgpack')
+        api = Api(app)
+
+        class Values(Resource):
+            async def get(self, request):
+                return TestBinaryOutput.values
+
+        api.add_resource(Values, '/')
+        _, response = app.test_client.get(
+            '/', headers={'Accept': 'application/msgpack'})
+        assert response.headers['Content-Type'] == 'application/msgpack'
+        assert msgpack.unpackb(response.body) == self.expected
+        assert list(api.representations)[0] == 'application/json'
+
+
+class TestNDJSON:
+    def test_ndjson(self):
+        app = Sanic('test_ndjson')
+        api = Api(app)
+        headers = {'Accept': 'application/x-ndjson'}
+
+        class Rows(Resource):
+            async def get(self, request):
+                return ({'id': i} for i in range(3))
+
+            async def post(self, request):
+                return [{'id': 0}, {'id': 1}], 201
+
+        class AsyncRows(Resource):
+            @marshal_with({'id': fields.Integer}, envelope='data')
+            async def get(self, request):
+                async def rows():
+                    for i in range(3):
+                        yield {'id': i, 'hidden': True}
+                return rows()
+
+        api.add_resource(Rows, '/rows')
+        api.add_resource(AsyncRows, '/async')
+
+        for url in ('/rows', '/async'):
+            _, response = app.test_client.get(url, headers=headers)
+            assert response.status == 200
+            assert response.headers['Content-Type'] == 'application/x-ndjson'
+            assert response.text == '{"id":0}\n{"id":1}\n{"id":2}\n'
+
+        _, response = app.test_client.post('/rows', headers=headers)
+        assert response.status == 201
+        assert response.text == '{"id":0}\n{"id":1}\n'
+
+        # generators are streamed as JSON arrays too
+        _, response = app.test_client.get('/rows')
+        assert response.json == [{'id': 0}, {'id': 1}, {'id': 2}]
+        _, response = app.test_client.get('/async')
+        assert response.json == {'data': [{'id': 0}, {'id': 1}, {'id': 2}]}
@@ -1,7 +1,7 @@
 import pytest
 from sanic import Sanic
 from sanic_restful import Api, Resource
-from sanic_restful.reqparse import RequestParser
+from sanic_restful.reqparse import RequestParameters, RequestParser
 
 
 simple_parser = RequestParser()
@@ -166,3 +166,47 @@ class TestParse:
         assert response.status == 400
         request, response = app.test_client.put('/null', json={'key': None})
         assert response.status == 200
+
+    def test_sources_resolved_once(self):
+        reads = []
+
+        class FakeRequest:
+            app = Sanic('test_sources_resolved_once')
+
+            def __getattr__(self, location):
+                reads.append(location)
+                if location == 'args':
+                    return RequestParameters([('a', '1'), ('b', '2')])
+                return None
+
+        parser = RequestParser()
+        parser.add_argument('a', type=int)
+        parser.add_argument('b')
+        parser.add_argument('c', location='args', default='c')
+        parser.add_argument('d', location=('args', 'json'))
+        args = parser.parse_args(FakeRequest())
+        assert args == {'a': 1, 'b': '2', 'c': 'c', 'd': None}
+        assert sorted(reads) == ['args', 'files', 'form', 'json']
+
+        assert [name for name, _, _ in parser.plan] == ['a', 'b', 'c', 'd']
+        parser.remove_argument('d')
+        assert [name for name, _, _ in parser.plan] == ['a', 'b', 'c']
+
+    def test_invalid_usage_not_shared(self):
+        app = Sanic('test_invalid_usage_not_shared')
+        api = Api(app)
+        parser = RequestParser()
+        parser.add_argument('a', location='json')
+        parser.add_argument('b', location='json', ignore_invalid_usage=False)
+
+        class Body(Resource):
+            async def post(self, request):
+                return dict(parser.parse_args(request))
+
+        api.add_resource(Body, '/')
+        headers = {'Content-Type': 'application/json'}
+        _, response = app.test_client.post('/', data='{x', headers=headers)
+        assert response.status == 400
+        _, response = app.test_client.post('/', data='{"b": 1}',
+                                           headers=headers)
+        assert response.json == {'a': None, 'b': 1}